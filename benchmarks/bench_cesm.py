@@ -0,0 +1,22 @@
+from climdyn_tools.cesm.load import load_dataset
+from .synthetic import get_cesm_archive
+
+
+class LoadDataset:
+    params = [[2, 10]]
+    param_names = ['n_years']
+
+    def setup(self, n_years):
+        self.archive_dir = get_cesm_archive(n_years=n_years)
+
+    def time_load_all(self, n_years):
+        load_dataset('synthetic', archive_dir=self.archive_dir)
+
+    def time_load_years(self, n_years):
+        load_dataset('synthetic', archive_dir=self.archive_dir, year_files='first1')
+
+    def time_load_months_compute(self, n_years):
+        load_dataset('synthetic', archive_dir=self.archive_dir, month_files=[6, 7, 8]).TREFHT.mean().compute()
+
+    def peakmem_load_all_compute(self, n_years):
+        load_dataset('synthetic', archive_dir=self.archive_dir).T.mean().compute()
@@ -0,0 +1,95 @@
+import warnings
+import numpy as np
+import xarray as xr
+from climdyn_tools.era5.get_jasmin_era5 import Find_era5
+from climdyn_tools.era5.get_jasmin_era5.utils import get_gz, get_pl, sel_era5
+from .synthetic import get_era5_archive, era5_grid
+
+DATE = slice('2020-06-01', '2020-06-02')
+
+
+class FindFiles:
+    params = [[1, 4]]
+    param_names = ['n_days']
+
+    def setup(self, n_days):
+        self.era5 = Find_era5(data_dir=get_era5_archive(n_days=n_days))
+        self.dates = Find_era5._get_dates(slice('2020-06-01', f'2020-06-{n_days + 1:02d}'))
+
+    def time_find_files(self, n_days):
+        self.era5.find_files('t', self.dates)
+
+    def time_find_files_batch(self, n_days):
+        self.era5.find_files_batch(['t', 'q', 'lnsp', '2t'], self.dates)
+
+
+class GetItem:
+    params = [[(19, 36), (73, 144)]]
+    param_names = ['grid']
+
+    def setup(self, grid):
+        warnings.simplefilter('ignore')
+        self.era5 = Find_era5(data_dir=get_era5_archive(n_lat=grid[0], n_lon=grid[1]))
+
+    def time_surface(self, grid):
+        self.era5['2t', DATE].load()
+
+    def time_model_levels_region(self, grid):
+        self.era5[['t', 'q'], DATE, slice(100, 137), slice(-60, 60), slice(-30, 30)].load()
+
+    def peakmem_model_levels(self, grid):
+        self.era5[['t', 'q', 'sp'], DATE].load()
+
+    def time_pl(self, grid):
+        self.era5.pl[DATE, slice(100, 137)].load()
+
+    def time_gz(self, grid):
+        self.era5.gz[DATE, slice(100, 137)].load()
+
+    def peakmem_gz(self, grid):
+        self.era5.gz[DATE, None].load()
+
+
+class HybridLevels:
+    params = [[1000, 100000], ['numpy', 'numba']]
+    param_names = ['n_columns', 'backend']
+
+    def setup(self, n_columns, backend):
+        if backend == 'numba':
+            try:
+                import numba
+            except ImportError:
+                raise NotImplementedError("numba not installed")       # asv skips benchmark
+        rng = np.random.default_rng(0)
+        self.ps = 1e5 * (1 + 0.02 * rng.standard_normal(n_columns))
+        self.gzs = rng.uniform(0, 2e4, n_columns)
+        self.T = 250 * (1 + 0.1 * rng.standard_normal((137, n_columns)))
+        self.q = 0.005 * (1 + 0.1 * rng.standard_normal((137, n_columns)))
+        get_gz(self.ps[:2], self.gzs[:2], self.T[:, :2], self.q[:, :2], 137, backend=backend)   # compile numba
+
+    def time_get_gz(self, n_columns, backend):
+        get_gz(self.ps, self.gzs, self.T, self.q, 137, backend=backend)
+
+    def peakmem_get_gz(self, n_columns, backend):
+        get_gz(self.ps, self.gzs, self.T, self.q, 137, backend=backend)
+
+    def time_get_pl(self, n_columns, backend):
+        get_pl(self.ps, 137)
+
+
+class SelEra5:
+    params = [[(181, 360), (721, 1440)], ['region', 'prime_meridian']]
+    param_names = ['grid', 'selection']
+
+    def setup(self, grid, selection):
+        lat, lon = era5_grid(*grid)
+        self.ds = xr.Dataset({'t2m': (('time', 'latitude', 'longitude'),
+                                      np.zeros((4,) + grid, dtype=np.float32))},
+                             coords={'time': np.arange(4), 'latitude': lat, 'longitude': lon})
+        if selection == 'region':
+            self.sel = {'longitude': slice(90, 270), 'latitude': slice(-60, 60)}
+        else:
+            self.sel = {'longitude': slice(-90, 90), 'latitude': slice(-60, 60)}
+
+    def time_sel_era5(self, grid, selection):
+        sel_era5(self.ds, self.sel).load()
@@ -0,0 +1,32 @@
+import numpy as np
+import xarray as xr
+from climdyn_tools.utils.ds_slicing import lat_lon_coord_slice, area_weight_mean_lat, lat_lon_rolling, time_rolling
+
+
+class DsSlicing:
+    params = [[(96, 144), (192, 288)]]
+    param_names = ['grid']
+
+    def setup(self, grid):
+        rng = np.random.default_rng(0)
+        lat = np.linspace(-90, 90, grid[0])
+        lon = np.arange(grid[1]) * 360 / grid[1]
+        self.ds = xr.Dataset({'t_surf': (('time', 'lat', 'lon'), rng.standard_normal((360,) + grid))},
+                             coords={'time': np.arange(360), 'lat': lat, 'lon': lon})
+        self.lat_points = rng.uniform(-90, 90, 1000)
+        self.lon_points = rng.uniform(0, 360, 1000)
+
+    def time_lat_lon_coord_slice(self, grid):
+        lat_lon_coord_slice(self.ds, self.lat_points, self.lon_points)
+
+    def time_area_weight_mean_lat(self, grid):
+        area_weight_mean_lat(self.ds.copy())
+
+    def time_lat_lon_rolling(self, grid):
+        lat_lon_rolling(self.ds, 5, 5)
+
+    def time_time_rolling(self, grid):
+        time_rolling(self.ds, 30)
+
+    def peakmem_time_rolling(self, grid):
+        time_rolling(self.ds, 30)
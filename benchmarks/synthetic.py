@@ -0,0 +1,203 @@
+"""
+Generators of small synthetic archives with the same directory and file name layout as the ERA5 archive on JASMIN
+and a CESM archive, so the loading functions can be benchmarked without access to JASMIN.
+
+The data are random, only the layout, dimensions and coordinates match the real archives.
+
+Examples:
+    ```
+    python -m benchmarks.synthetic /tmp/synthetic --n_days 2 --n_years 5
+    ```
+"""
+import os
+import argparse
+import tempfile
+import cftime
+import numpy as np
+import pandas as pd
+import xarray as xr
+from typing import Tuple
+
+ERA5_ML_VARS = {'t': 250, 'q': 0.005}           # typical value of each model level variable
+ERA5_SFC_VARS = {'2t': ('t2m', 280), '10u': ('u10', 5)}     # file name variable: (name in file, typical value)
+CESM_VARS_2D = {'TREFHT': 280, 'PS': 1e5}
+CESM_VARS_3D = {'T': 250, 'Q': 0.005}
+
+
+def era5_grid(n_lat: int, n_lon: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Args:
+        n_lat: Number of latitudes.
+        n_lon: Number of longitudes.
+
+    Returns:
+        lat: `float [n_lat]`</br>
+            Latitudes, decreasing from 90 to -90 as in ERA5 files.
+        lon: `float [n_lon]`</br>
+            Longitudes, increasing from 0.
+    """
+    return (np.linspace(90, -90, n_lat).astype(np.float32),
+            (np.arange(n_lon) * 360 / n_lon).astype(np.float32))
+
+
+def make_era5_archive(data_dir: str, start: str = '2020-06-01', n_days: int = 1, n_lat: int = 19,
+                      n_lon: int = 36, n_levels: int = 137, seed: int = 0) -> str:
+    """
+    Creates hourly model level files of `t`, `q` and `lnsp`, surface files of `2t` and `10u` and
+    the invariant file of `z`, in the same layout as `/badc/ecmwf-era5/data/`.
+
+    Args:
+        data_dir: Directory in which to create the `oper/` and `invariants/` directories.
+        start: First day of data.
+        n_days: Number of days of hourly data.
+        n_lat: Number of latitudes.
+        n_lon: Number of longitudes.
+        n_levels: Number of model levels, levels are numbered from 1 at the top.
+        seed: Seed of random number generator.
+
+    Returns:
+        `data_dir`, which can be passed to `Find_era5(data_dir=...)`.
+    """
+    rng = np.random.default_rng(seed)
+    lat, lon = era5_grid(n_lat, n_lon)
+    level = np.arange(1, n_levels + 1, dtype=np.int32)
+    for time in pd.date_range(start, periods=24 * n_days, freq='1h'):
+        stamp = f"{time:%Y%m%d%H%M}"
+        ml_dir = os.path.join(data_dir, 'oper', 'an_ml', f"{time:%Y/%m/%d}")
+        sfc_dir = os.path.join(data_dir, 'oper', 'an_sfc', f"{time:%Y/%m/%d}")
+        os.makedirs(ml_dir, exist_ok=True)
+        os.makedirs(sfc_dir, exist_ok=True)
+        coords = {'time': [time], 'latitude': lat, 'longitude': lon}
+        for var, value in ERA5_ML_VARS.items():
+            data = value * (1 + 0.1 * rng.standard_normal((1, n_levels, n_lat, n_lon)))
+            xr.Dataset({var: (('time', 'level', 'latitude', 'longitude'), data.astype(np.float32))},
+                       coords={**coords, 'level': level}).to_netcdf(
+                os.path.join(ml_dir, f"ecmwf-era5_oper_an_ml_{stamp}.{var}.nc"))
+        data = np.log(1e5 * (1 + 0.02 * rng.standard_normal((1, n_lat, n_lon))))
+        xr.Dataset({'lnsp': (('time', 'latitude', 'longitude'), data.astype(np.float32))}, coords=coords).to_netcdf(
+            os.path.join(ml_dir, f"ecmwf-era5_oper_an_ml_{stamp}.lnsp.nc"))
+        for var, (name, value) in ERA5_SFC_VARS.items():
+            data = value * (1 + 0.05 * rng.standard_normal((1, n_lat, n_lon)))
+            xr.Dataset({name: (('time', 'latitude', 'longitude'), data.astype(np.float32))},
+                       coords=coords).to_netcdf(os.path.join(sfc_dir, f"ecmwf-era5_oper_an_sfc_{stamp}.{var}.nc"))
+    os.makedirs(os.path.join(data_dir, 'invariants'), exist_ok=True)
+    data = rng.uniform(0, 2e4, (1, n_lat, n_lon))
+    xr.Dataset({'z': (('time', 'latitude', 'longitude'), data.astype(np.float32))},
+               coords={'time': [pd.Timestamp('2000-01-01')], 'latitude': lat, 'longitude': lon}).to_netcdf(
+        os.path.join(data_dir, 'invariants', 'ecmwf-era5_oper_an_sfc_200001010000.z.inv.nc'))
+    return data_dir
+
+
+def make_cesm_archive(archive_dir: str, exp_name: str = 'synthetic', start_year: int = 1, n_years: int = 2,
+                      n_lat: int = 19, n_lon: int = 36, n_lev: int = 32, seed: int = 0) -> str:
+    """
+    Creates monthly `h0` atmosphere files in the same layout and time convention as a CESM archive
+    i.e. `{archive_dir}/{exp_name}/atm/hist/{exp_name}.cam.h0.YYYY-MM.nc`, with the time of each
+    file at the end of the month averaged over and a `noleap` calendar.
+
+    Args:
+        archive_dir: Directory in which to create the experiment directory.
+        exp_name: Name of experiment.
+        start_year: First year of data.
+        n_years: Number of years of monthly data.
+        n_lat: Number of latitudes.
+        n_lon: Number of longitudes.
+        n_lev: Number of hybrid levels.
+        seed: Seed of random number generator.
+
+    Returns:
+        `archive_dir`, which can be passed to `load_dataset(archive_dir=...)`.
+    """
+    rng = np.random.default_rng(seed)
+    hist_dir = os.path.join(archive_dir, exp_name, 'atm', 'hist')
+    os.makedirs(hist_dir, exist_ok=True)
+    lat = np.linspace(-90, 90, n_lat)
+    lon = np.arange(n_lon) * 360 / n_lon
+    lev = np.linspace(3, 993, n_lev)
+    units = 'days since 0001-01-01 00:00:00'
+    for year in range(start_year, start_year + n_years):
+        for month in range(1, 13):
+            time_end = cftime.DatetimeNoLeap(year + month // 12, month % 12 + 1, 1)
+            time_start = cftime.DatetimeNoLeap(year, month, 1)
+            bnds = cftime.date2num([time_start, time_end], units, calendar='noleap')
+            ds = xr.Dataset(coords={'time': ('time', [bnds[1]], {'units': units, 'calendar': 'noleap',
+                                                                 'bounds': 'time_bnds'}),
+                                    'lev': ('lev', lev, {'units': 'level'}),
+                                    'lat': ('lat', lat, {'units': 'degrees_north'}),
+                                    'lon': ('lon', lon, {'units': 'degrees_east'})})
+            ds['time_bnds'] = (('time', 'nbnd'), bnds[np.newaxis])
+            ds['hyam'] = ('lev', np.linspace(0.002, 0, n_lev))
+            ds['hybm'] = ('lev', np.linspace(0, 0.99, n_lev))
+            ds['P0'] = 1e5
+            for var, value in CESM_VARS_2D.items():
+                ds[var] = (('time', 'lat', 'lon'),
+                           (value * (1 + 0.05 * rng.standard_normal((1, n_lat, n_lon)))).astype(np.float32))
+            for var, value in CESM_VARS_3D.items():
+                ds[var] = (('time', 'lev', 'lat', 'lon'),
+                           (value * (1 + 0.1 * rng.standard_normal((1, n_lev, n_lat, n_lon)))).astype(np.float32))
+            ds.to_netcdf(os.path.join(hist_dir, f"{exp_name}.cam.h0.{year:04d}-{month:02d}.nc"))
+    return archive_dir
+
+
+def cached_dir(name: str) -> str:
+    """
+    Directory in which to create a synthetic archive, shared between benchmark runs so each archive is only made once.
+
+    Args:
+        name: Name of archive, should include all parameters used to make it.
+
+    Returns:
+        Path to directory within the system temporary directory.
+    """
+    return os.path.join(tempfile.gettempdir(), 'climdyn_tools_benchmarks', name)
+
+
+def get_era5_archive(n_days: int = 1, n_lat: int = 19, n_lon: int = 36) -> str:
+    """
+    Returns a synthetic ERA5 archive with the given size, creating it if it does not yet exist.
+
+    Args:
+        n_days: Number of days of hourly data.
+        n_lat: Number of latitudes.
+        n_lon: Number of longitudes.
+
+    Returns:
+        Path to the archive `data/` directory.
+    """
+    data_dir = cached_dir(f"era5_{n_days}d_{n_lat}x{n_lon}")
+    if not os.path.exists(os.path.join(data_dir, 'complete')):
+        make_era5_archive(data_dir, n_days=n_days, n_lat=n_lat, n_lon=n_lon)
+        open(os.path.join(data_dir, 'complete'), 'w').close()
+    return data_dir
+
+
+def get_cesm_archive(n_years: int = 2, n_lat: int = 19, n_lon: int = 36) -> str:
+    """
+    Returns a synthetic CESM archive with the given size, creating it if it does not yet exist.
+    The experiment is called `synthetic`.
+
+    Args:
+        n_years: Number of years of monthly data.
+        n_lat: Number of latitudes.
+        n_lon: Number of longitudes.
+
+    Returns:
+        Path to the archive directory.
+    """
+    archive_dir = cached_dir(f"cesm_{n_years}y_{n_lat}x{n_lon}")
+    if not os.path.exists(os.path.join(archive_dir, 'complete')):
+        make_cesm_archive(archive_dir, n_years=n_years, n_lat=n_lat, n_lon=n_lon)
+        open(os.path.join(archive_dir, 'complete'), 'w').close()
+    return archive_dir
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create synthetic ERA5 and CESM archives.")
+    parser.add_argument('out_dir', help="Directory in which to create `era5/` and `cesm/` archives.")
+    parser.add_argument('--n_days', type=int, default=1, help="Days of hourly ERA5 data.")
+    parser.add_argument('--n_years', type=int, default=2, help="Years of monthly CESM data.")
+    parser.add_argument('--n_lat', type=int, default=19)
+    parser.add_argument('--n_lon', type=int, default=36)
+    args = parser.parse_args()
+    make_era5_archive(os.path.join(args.out_dir, 'era5'), n_days=args.n_days, n_lat=args.n_lat, n_lon=args.n_lon)
+    make_cesm_archive(os.path.join(args.out_dir, 'cesm'), n_years=args.n_years, n_lat=args.n_lat, n_lon=args.n_lon)
@@ -1,32 +1,35 @@
-import urllib.request
-import glob, re, json
+import glob, re
 from intake_esgf import ESGFCatalog
+from intake_esgf.exceptions import NoSearchResults
 import pandas as pd
 import xarray as xr
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union, Tuple
+from .ceda_index import Ceda_index
+from .esgf_session import Esgf_session, get_session
+from .cv import Cmip6_cv, load_cv
+from .staging import stage_catalog
+from ..utils.chunking import plan_chunks, file_chunks, dims_chunks
 
 
-def source_id_in_activity(activity_id: str, CMIP6Meta: dict) -> List[str]:
+def source_id_in_activity(activity_id: str, CMIP6Meta: Union[dict, Cmip6_cv]) -> List[str]:
     """
 
     Args:
         activity_id: e.g. "CMIP", "ScenarioMIP"
-        CMIP6Meta: Parsed JSON from CMIP6_source_id.json
+        CMIP6Meta: Parsed JSON from CMIP6_source_id.json, or its `Cmip6_cv` from `load_cv`.
 
     Returns:
         sil: List of source_id names that participate in the activity.
     """
-    sil = []
-    for source_id, meta in CMIP6Meta.get("source_id", {}).items():
-        activities = meta.get("activity_participation", [])
-        if activity_id in activities:
-            sil.append(source_id)
-    return sil
+    return cv_from_meta(CMIP6Meta).sources_in_activity(activity_id)
 
 
 def load_cmip6_source_id(local_path: Optional[str]=None) -> dict:
     """
-    Load CMIP6 source_id controlled vocabulary JSON. Tries local path first, then GitHub if not found.
+    Load CMIP6 source_id controlled vocabulary JSON. Tries local path first, then a copy saved in
+    `~/.cache/climdyn_tools/cmip6_cv/`, which is downloaded from GitHub if missing or out of date
+    (see `load_cv`). The JSON is only read once per process.
 
     Args:
         local_path: Path to local CMIP6_source_id.json
@@ -34,36 +37,36 @@ def load_cmip6_source_id(local_path: Optional[str]=None) -> dict:
     Returns:
         data: Parsed JSON content
     """
-    url = "https://raw.githubusercontent.com/WCRP-CMIP/CMIP6_CVs/main/CMIP6_source_id.json"
+    return load_cv(local_path).data
 
-    # Try local file first
-    if local_path is not None and os.path.exists(local_path):
-        with open(local_path) as f:
-            data = json.load(f)
-    else:
-        with urllib.request.urlopen(url) as f:
-            data = json.load(f)
 
-    return data
+def cv_from_meta(CMIP6Meta: Union[dict, Cmip6_cv]) -> Cmip6_cv:
+    """
+    Args:
+        CMIP6Meta: Parsed JSON from CMIP6_source_id.json, or its controlled vocabulary.
+
+    Returns:
+        Controlled vocabulary of `CMIP6Meta`. A dictionary is indexed again on every call, so to do several
+            lookups pass the `Cmip6_cv` returned by `load_cv`, which is only built once per process.
+    """
+    return CMIP6Meta if isinstance(CMIP6Meta, Cmip6_cv) else Cmip6_cv(CMIP6Meta)
+
 
-def getModel_to_inst(CMIP6Meta: dict) -> dict:
+def getModel_to_inst(CMIP6Meta: Union[dict, Cmip6_cv]) -> dict:
     """
     Build a mapping from CMIP6 source_id (model name)
     to its first listed institution_id.
 
     Args:
-        CMIP6Meta: Parsed JSON from CMIP6_source_id.json
+        CMIP6Meta: Parsed JSON from CMIP6_source_id.json, or its `Cmip6_cv` from `load_cv`.
 
     Returns:
         Dictionary of the form `{source_id: institution_id}`
     """
-    return {
-        source_id: (attrs.get("institution_id", [None])[0])
-        for source_id, attrs in CMIP6Meta.get("source_id", {}).items()
-    }
+    return dict(cv_from_meta(CMIP6Meta).source_institution)
 
 def checkCEDA(source_id: str, activity_id: str, experiment_id: str, M2I: dict, variableList: List[str],
-              table_id: str, member_id: str = '*') -> pd.DataFrame:
+              table_id: str, member_id: str = '*', index: Optional[Union[str, Ceda_index]] = None) -> pd.DataFrame:
     """
     For a given source_id (model), check which variables have data on CEDA,
     and return a DataFrame similar to intake-esm format, combining paths for identical metadata.
@@ -76,6 +79,9 @@ def checkCEDA(source_id: str, activity_id: str, experiment_id: str, M2I: dict, v
         variableList: Variables to check (e.g. `['tas','rlut']`)
         table_id: Corresponding CMIP6 table_id e.g. 'Amon'
         member_id: The member Id specifically looked for - can be a wild car when searching for all members
+        index: Optional `Ceda_index` of the CEDA archive, or the path to its SQLite file.
+            If given, files are found with a single query of the index rather than a `glob` of the archive
+            for each variable, and `grid_label` and `version` are those of the files rather than placeholders.
 
     Returns:
         DataFrame with the following columns:</br>
@@ -85,53 +91,48 @@ def checkCEDA(source_id: str, activity_id: str, experiment_id: str, M2I: dict, v
             Note that `'id'` contains a list of file paths for each unique combination of metadata.
     """
     inst = M2I.get(source_id)
-    if inst is None:
-        raise ValueError(f"No institution_id mapping found for source_id={SID}")
-
-    records = []
-    for variable in variableList:
-        search_pattern = (
-            f"/badc/cmip6/data/CMIP6/{activity_id}/"
-            f"{inst}/{source_id}/{experiment_id}/{member_id}/"
-            f"{table_id}/{variable}/*/latest/*.nc"
-        )
-        paths = glob.glob(search_pattern)
-        if not paths:
-            continue
-
-        # Extract variant info
-        variant_df = parse_variant_labels(paths)
-
-        # Build record for each file
-        for idx, row in variant_df.iterrows():
-            records.append({
-                "project": "CMIP6",
-                "mip_era": "CMIP6",
-                "activity_id": activity_id,
-                "institution_id": inst,
-                "source_id": source_id,
-                "experiment_id": experiment_id,
-                "member_id": row["member_id"],
-                "table_id": table_id,
-                "variable_id": variable,
-                "grid_label": "gn",       # assuming native grid; could parse if needed
-                "version": "latest",      # placeholder
-                "id": row["path"]
-            })
-
-    df = pd.DataFrame(records)
+    if index is not None:
+        if isinstance(index, str):
+            index = Ceda_index(index)
+        df = index.search(activity_id=activity_id, source_id=source_id, experiment_id=experiment_id,
+                          member_id=member_id, table_id=table_id, variable_id=list(variableList))
+        df = df.rename(columns={'path': 'id'})
+    else:
+        if inst is None:
+            raise ValueError(f"No institution_id mapping found for source_id={source_id}")
+        tables = []
+        for variable in variableList:
+            search_pattern = (
+                f"/badc/cmip6/data/CMIP6/{activity_id}/"
+                f"{inst}/{source_id}/{experiment_id}/{member_id}/"
+                f"{table_id}/{variable}/*/latest/*.nc"
+            )
+            paths = pd.Series(sorted(glob.glob(search_pattern)), dtype=object)
+            tables.append(pd.DataFrame({'member_id': paths.str.extract(r"(r\d+i\d+p\d+f\d+)", expand=False),
+                                        'variable_id': variable, 'id': paths}))
+        df = pd.concat(tables, ignore_index=True) if len(tables) > 0 else pd.DataFrame()
+        if not df.empty:
+            if df['member_id'].isna().any():
+                raise ValueError(f"No valid variant_label found in: {df['id'][df['member_id'].isna()].iloc[0]}")
+            df = df.assign(activity_id=activity_id, institution_id=inst, source_id=source_id,
+                           experiment_id=experiment_id, table_id=table_id,
+                           grid_label="gn",       # assuming native grid; could parse if needed
+                           version="latest")      # placeholder
 
     if not df.empty:
+        df = df.assign(project="CMIP6", mip_era="CMIP6")
         # Combine rows with identical metadata except 'id' into a single row with list of ids
         group_cols = ['project', 'mip_era', 'activity_id', 'institution_id',
                       'source_id', 'experiment_id', 'member_id', 'table_id',
                       'variable_id', 'grid_label', 'version']
         df = df.groupby(group_cols, as_index=False)['id'].agg(list)
+    else:
+        df = pd.DataFrame()
 
     return df
 
 def checkESGF(source_id: str, activity_id: str, experiment_id: str, M2I: dict, variableList: List[str], table_id: str,
-              member_id: str = '*') -> pd.DataFrame:
+              member_id: str = '*', session: Optional[Esgf_session] = None) -> ESGFCatalog:
     """
 
     Args:
@@ -142,33 +143,22 @@ def checkESGF(source_id: str, activity_id: str, experiment_id: str, M2I: dict, v
         variableList: Variables to check (e.g. `['tas','rlut']`)
         table_id: Corresponding CMIP6 table_id e.g. 'Amon'
         member_id: The member Id specifically looked for - can be a wild car when searching for all members
+        session: Session used to search, so repeated searches are read from its cache.
+            If `None`, will be the session returned by `get_session()`.
 
     Returns:
-        DataFrame with the following columns:</br>
+        Catalog with search results in `df`, which has the following columns:</br>
             `['project', 'mip_era', 'activity_id', 'institution_id',
                   'source_id', 'experiment_id', 'member_id', 'table_id',
                   'variable_id', 'grid_label', 'version', 'id']`</br>
-            Note that `'id'` contains a list of file paths for each unique combination of metadata.
+            Note that `'id'` contains a list of dataset ids for each unique combination of metadata.
     """
-    cat = initializeCat()
-    if member_id == '*':
-        cat.search(
-            source_id=[source_id],
-            activity_drs=[activity_id],
-            experiment_id=[experiment_id],
-            variable_id=variableList,
-            table_id=table_id
-        )
-    else: 
-        cat.search(
-            source_id=[source_id],
-            activity_drs=[activity_id],
-            variant_label = [member_id],
-            experiment_id=[experiment_id],
-            variable_id=variableList,
-            table_id=table_id
-        )
-    return cat
+    session = get_session() if session is None else session
+    search = dict(source_id=[source_id], activity_drs=[activity_id], experiment_id=[experiment_id],
+                  variable_id=variableList, table_id=table_id)
+    if member_id != '*':
+        search['variant_label'] = [member_id]
+    return session.search(**search)
 
 def parse_variant_labels(paths: List[str]) -> pd.DataFrame:
     """
@@ -197,37 +187,18 @@ def parse_variant_labels(paths: List[str]) -> pd.DataFrame:
 
 def initializeCat() -> Optional[ESGFCatalog]:
     """
-    Attempt to initialize an ESGFCatalog object with multiple retries.
+    Returns an empty ESGFCatalog ready for a search, from the session shared by the process.
 
-    The function tries up to 20 times to create an ESGFCatalog instance,
-    waiting a random interval between 15 and 60 seconds between attempts
-    if initialization fails. This helps handle transient network or server issues.
+    The catalog of the session is only initialised the first time, retrying with exponential backoff
+    and jitter if this fails (see `retry_with_backoff`).
 
     Returns:
         Successfully initialized ESGFCatalog object.
 
     Raises:
-        RuntimeError: If the catalog cannot be initialized after 20 attempts.
-
-    Notes:
-        Each attempt logs its progress, and the exception is encountered if it fails.
+        RuntimeError: If the catalog cannot be initialized after 20 attempts or 10 minutes.
     """
-    import random
-    import time
-    for attempt in range(1, 21):
-        try:
-            print(f"Attempt {attempt} to initialize ESGFCatalog...")
-            cat = ESGFCatalog()
-            print("ESGFCatalog successfully initialized.")
-            return cat  # success!
-        except Exception as e:
-            print(f"[Attempt {attempt}] ESGFCatalog failed to load: {e}")
-            if attempt < 20:
-                wait_time = random.randint(15, 60)
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                raise RuntimeError("Failed to initialize ESGFCatalog after multiple attempts.") from e
+    return get_session().catalog()
 
 
 def compare_cat_res_pivot(cat_df: pd.DataFrame, res_df: pd.DataFrame) -> pd.DataFrame:
@@ -257,28 +228,30 @@ def compare_cat_res_pivot(cat_df: pd.DataFrame, res_df: pd.DataFrame) -> pd.Data
     missing_res_cols = required_cols - set(res_df.columns)
     if res_df.empty or missing_res_cols:
         print("Warning: res_df is empty or missing required columns. Marking all entries as 'ESGF_ONLY'")
-        cat_set = set(cat_df[['member_id', 'variable_id']].itertuples(index=False, name=None))
-        records = [{'member_id': k[0], 'variable_id': k[1], 'status': 'ESGF_ONLY'} for k in cat_set]
-        df = pd.DataFrame(records)
-        return df.pivot(index='member_id', columns='variable_id', values='status')
-
-    # Proceed with normal comparison
-    cat_set = set(cat_df[['member_id', 'variable_id']].itertuples(index=False, name=None))
-    res_set = set(res_df[['member_id', 'variable_id']].itertuples(index=False, name=None))
-    all_keys = cat_set | res_set
-    
-    records = []
-    for key in all_keys:
-        if key in cat_set and key in res_set:
-            status = 'CEDA_CHOICE'
-        elif key in cat_set:
-            status = 'ESGF_ONLY'
-        else:
-            status = 'CEDA_ONLY'
-        records.append({'member_id': key[0], 'variable_id': key[1], 'status': status})
-
-    df = pd.DataFrame(records)
-    return df.pivot(index='member_id', columns='variable_id', values='status')
+        res_df = pd.DataFrame(columns=['member_id', 'variable_id'])
+    return availability_status(cat_df, res_df, ['member_id']).pivot(index='member_id', columns='variable_id',
+                                                                    values='status')
+
+
+def availability_status(esgf_df: pd.DataFrame, ceda_df: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """
+    Finds where each combination of `keys` and `variable_id` is available.
+
+    Args:
+        esgf_df: Datasets available on ESGF, with columns `keys` and `variable_id`.
+        ceda_df: Datasets available on CEDA, with columns `keys` and `variable_id`.
+        keys: Columns identifying a member e.g. `['member_id']` or `['source_id', 'experiment_id', 'member_id']`.
+
+    Returns:
+        DataFrame with a row for each combination, with columns `keys`, `variable_id` and `status`, which is
+            `CEDA_CHOICE` if available on both, `ESGF_ONLY` if only on ESGF and `CEDA_ONLY` if only on CEDA.
+    """
+    cols = list(keys) + ['variable_id']
+    df = esgf_df[cols].drop_duplicates().merge(ceda_df[cols].drop_duplicates(), on=cols, how='outer',
+                                               indicator=True)
+    status = df.pop('_merge').map({'both': 'CEDA_CHOICE', 'left_only': 'ESGF_ONLY', 'right_only': 'CEDA_ONLY'})
+    return df.assign(status=status.astype(str))
+
     
 def extract_r(member_id: str) -> int:
     """
@@ -312,6 +285,9 @@ def rank_members_with_vars(pivot: pd.DataFrame) -> pd.DataFrame:
             - `"ESGF_ONLY"`: Variable only available via ESGF.
             - `"CEDA_ONLY"`: Variable only available via CEDA.
 
+            The index can also have other levels before `member_id` e.g. `source_id` as returned by `survey`,
+            in which case members are ranked within each combination of these.
+
     Returns:
         A dataframe with one row per member containing (the dataframe is sorted descending by `CEDA_CHOICE_count`,
         ascending by `ESGF_ONLY_count`, and ascending by `r`):
@@ -324,38 +300,94 @@ def rank_members_with_vars(pivot: pd.DataFrame) -> pd.DataFrame:
             - `ESGF_vars`: List of variable_ids available only via ESGF.
             - `r`: Extracted r-number from the member_id.
     """
-    records = []
-    for member_id, row in pivot.iterrows():
-        # row is a Series: index = variable_id, value = status
-        ceda_vars = row[row == "CEDA_CHOICE"].index.tolist()
-        esgf_vars = row[row == "ESGF_ONLY"].index.tolist()
-        ceda_only_vars = row[row == "CEDA_ONLY"].index.tolist()
-
-        records.append({
-            "member_id": member_id,
-            "CEDA_CHOICE_count": len(ceda_vars),
-            "ESGF_ONLY_count": len(esgf_vars),
-            "CEDA_ONLY_count": len(ceda_only_vars),
-            "CEDA_vars": ceda_vars,
-            "ESGF_vars": esgf_vars,
-            "r": extract_r(member_id),
-        })
-
-    df = pd.DataFrame(records)
+    keys = list(pivot.index.names)
+    if keys == [None]:
+        keys = ['member_id']
+        pivot = pivot.rename_axis('member_id')
+    group_keys = keys[:-1]
+    long = pivot.rename_axis(columns='variable_id').stack().rename('status').reset_index()
+    counts = long.groupby(keys + ['status']).size().unstack('status')
+    counts = counts.reindex(columns=['CEDA_CHOICE', 'ESGF_ONLY', 'CEDA_ONLY'], fill_value=0).fillna(0).astype(int)
+    var_lists = long.groupby(keys + ['status'])['variable_id'].agg(list).unstack('status')
+    var_lists = var_lists.reindex(columns=['CEDA_CHOICE', 'ESGF_ONLY'])
+    df = pd.DataFrame({
+        "CEDA_CHOICE_count": counts['CEDA_CHOICE'],
+        "ESGF_ONLY_count": counts['ESGF_ONLY'],
+        "CEDA_ONLY_count": counts['CEDA_ONLY'],
+        "CEDA_vars": [v if isinstance(v, list) else [] for v in var_lists['CEDA_CHOICE']],
+        "ESGF_vars": [v if isinstance(v, list) else [] for v in var_lists['ESGF_ONLY']],
+    }, index=counts.index).reset_index()
+    r = df[keys[-1]].str.extract(r"^r(\d+)i\d+p\d+f\d+", expand=False)
+    if r.isna().any():
+        raise ValueError(f"Could not parse r-number from member_id: {df[keys[-1]][r.isna()].iloc[0]}")
+    df["r"] = r.astype(int)
 
     # Sort by: CEDA_CHOICE descending, ESGF_ONLY ascending, then r ascending
     df_sorted = df.sort_values(
-        by=["CEDA_CHOICE_count", "ESGF_ONLY_count", "r"],
-        ascending=[False, True, True]
+        by=group_keys + ["CEDA_CHOICE_count", "ESGF_ONLY_count", "r"],
+        ascending=[True] * len(group_keys) + [False, True, True]
     ).reset_index(drop=True)
 
     return df_sorted
 
 
+def survey(source_ids: List[str], experiments: List[str], variables: List[str], table_id: str,
+           index: Union[str, Ceda_index], activity_id: Optional[str] = None,
+           session: Optional[Esgf_session] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Finds which members of many models have each variable available on CEDA and ESGF,
+    as `checkCEDA`, `checkESGF`, `compare_cat_res_pivot` and `rank_members_with_vars` do for a single model.
+
+    The CEDA side is a single query of `index`, and the ESGF side a single search for all models and experiments.
+
+    Args:
+        source_ids: Models to survey e.g. `['MPI-ESM1-2-HR', 'NorESM2-LM']`.
+        experiments: Experiments to survey e.g. `['historical', 'ssp585']`.
+        variables: Variables to check e.g. `['tas', 'rlut']`.
+        table_id: Corresponding CMIP6 table_id e.g. 'Amon'
+        index: `Ceda_index` of the CEDA archive, or the path to its SQLite file.
+        activity_id: Optional CMIP6 activity (e.g. "CMIP"). If `None`, all activities are searched.
+        session: Session used to search ESGF, so repeated surveys are read from its cache.
+            If `None`, will be the session returned by `get_session()`.
+
+    Returns:
+        pivot: Pivot table with index `(source_id, experiment_id, member_id)`, columns `variable_id` and values
+            `CEDA_CHOICE`, `ESGF_ONLY` or `CEDA_ONLY` as for `compare_cat_res_pivot`.
+        ranking: Ranking of members within each model and experiment as for `rank_members_with_vars`,
+            with additional columns `source_id` and `experiment_id`.
+    """
+    keys = ['source_id', 'experiment_id', 'member_id']
+    if isinstance(index, str):
+        index = Ceda_index(index)
+    ceda_df = index.search(activity_id=activity_id, source_id=list(source_ids), experiment_id=list(experiments),
+                           table_id=table_id, variable_id=list(variables))
+    search = dict(source_id=list(source_ids), experiment_id=list(experiments), variable_id=list(variables),
+                  table_id=table_id)
+    if activity_id is not None:
+        search['activity_drs'] = [activity_id]
+    try:
+        esgf_df = (get_session() if session is None else session).search(**search).df
+    except NoSearchResults:
+        esgf_df = pd.DataFrame(columns=keys + ['variable_id'])
+    status = availability_status(esgf_df, ceda_df, keys)
+    pivot = status.pivot(index=keys, columns='variable_id', values='status')
+    return pivot, rank_members_with_vars(pivot)
+
+
 def getCombinedData(source_id: str, activity_id: str, experiment_id: str, M2I: dict,
                     CEDA_vars: List[str], ESGF_vars: List[str], table_id: str, member_id: str,
-                    doReadOut: bool = False) -> xr.Dataset:
+                    doReadOut: bool = False, index: Optional[Union[str, Ceda_index]] = None,
+                    session: Optional[Esgf_session] = None, staging_dir: Optional[str] = None,
+                    max_workers: int = 8) -> xr.Dataset:
     """
+    Finds and opens the CEDA files while the ESGF files are being downloaded, so the slower of the two sets
+    the time taken rather than their sum.
+
+    ESGF files already in a data root or local cache of `intake_esgf` are read in place. Others are downloaded
+    concurrently into `staging_dir` with `stage_catalog`, where downloads resume if interrupted and are only
+    kept if their checksum matches, so files already there are not downloaded again.
+    All files are opened lazily, with chunks chosen by `climdyn_tools.utils.chunking.plan_chunks`, and the CEDA
+    chunks of dimensions shared with ESGF match the ESGF chunks, so the merge neither rechunks nor loads any data.
 
     Args:
         source_id: CMIP6 model/source ID (e.g., 'NorESM2-LM').
@@ -367,6 +399,10 @@ def getCombinedData(source_id: str, activity_id: str, experiment_id: str, M2I: d
         table_id: CMIP6 table ID (e.g., 'Amon', 'Lmon').
         member_id: Variant label for the ensemble member (e.g., 'r1i1p1f1').
         doReadOut: Whether to print while loading or not
+        index: Optional `Ceda_index` of the CEDA archive, or the path to its SQLite file, passed to `checkCEDA`.
+        session: Session used to search ESGF. If `None`, will be the session returned by `get_session()`.
+        staging_dir: Directory in which to save ESGF files. If `None`, will be the `intake_esgf` local cache.
+        max_workers: Number of ESGF files downloaded at the same time.
 
     Returns:
         Combined xarray Dataset containing requested variables from CEDA and ESGF.
@@ -374,30 +410,66 @@ def getCombinedData(source_id: str, activity_id: str, experiment_id: str, M2I: d
             - If only CEDA_vars exist, returns CEDA dataset.
             - If only ESGF_vars exist, returns ESGF dataset.
             - If both exist, returns merged dataset.
-    """
-    ds = None  # placeholder
+            - If neither is given, returns `None`.
 
-    if len(CEDA_vars) != 0:
+    Raises:
+        ValueError: If no CEDA files are found for any of `CEDA_vars`.
+    """
+    def load_ceda() -> Tuple[xr.Dataset, dict]:
         if doReadOut:
             print('loading CEDA Variables')
-        CEDA_paths = checkCEDA(
-            source_id, activity_id, experiment_id, M2I,
-            CEDA_vars, table_id, member_id=member_id
-        )
-        CEDA_paths = sum(CEDA_paths["id"].tolist(), [])
-        CEDA_ds = xr.open_mfdataset(CEDA_paths, combine='by_coords')
-        ds = CEDA_ds
-
-    if len(ESGF_vars) != 0:
+        CEDA_paths = checkCEDA(source_id, activity_id, experiment_id, M2I, CEDA_vars, table_id,
+                               member_id=member_id, index=index)
+        found = set() if CEDA_paths.empty else set(CEDA_paths['variable_id'])
+        missing = [var for var in CEDA_vars if var not in found]
+        if len(missing) > 0:
+            raise ValueError(f"No CEDA files found for {missing} of {source_id} {experiment_id} {member_id} "
+                             f"{table_id}, load them from ESGF instead")
+        return _open_planned(sum(CEDA_paths["id"].tolist(), []))
+
+    def load_esgf() -> List[Tuple[xr.Dataset, dict]]:
         if doReadOut:
             print('loading ESGF Variables')
-        ESGF_paths = checkESGF(
-            source_id, activity_id, experiment_id, M2I,
-            ESGF_vars, table_id, member_id=member_id
-        )
-        ESGF_ds = ESGF_paths.to_dataset_dict(add_measures=False, prefer_streaming=False)
-        ESGF_ds = xr.merge([d for d in ESGF_ds.values()])
-        ds = ESGF_ds if ds is None else xr.merge([ds, ESGF_ds], compat="override")
-
+        cat = checkESGF(source_id, activity_id, experiment_id, M2I, ESGF_vars, table_id,
+                        member_id=member_id, session=session)
+        ESGF_paths = stage_catalog(cat, staging_dir, max_workers, quiet=not doReadOut)
+        return [_open_planned(ESGF_paths[key]) for key in sorted(ESGF_paths)]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        CEDA_future = executor.submit(load_ceda) if len(CEDA_vars) != 0 else None
+        ESGF_future = executor.submit(load_esgf) if len(ESGF_vars) != 0 else None
+        CEDA_ds = None if CEDA_future is None else CEDA_future.result()
+        ESGF_ds = [] if ESGF_future is None else ESGF_future.result()
+
+    # Chunks of the first ESGF dataset are used for all dimensions it shares with the other datasets
+    if CEDA_ds is None and len(ESGF_ds) == 0:
+        return None
+    ref_ds, ref_chunks = ESGF_ds[0] if len(ESGF_ds) > 0 else CEDA_ds
+    reference = ref_ds.chunk(dims_chunks(ref_chunks, ref_ds.dims))
+    ds = None
+    if len(ESGF_ds) > 0:
+        ds = xr.merge([_align_chunks(ds_var, chunks, reference) for ds_var, chunks in ESGF_ds])
+    if CEDA_ds is not None:
+        # CEDA is first in the merge, so its coordinates are kept where they differ from ESGF
+        CEDA_ds = _align_chunks(*CEDA_ds, reference)
+        ds = CEDA_ds if ds is None else xr.merge([CEDA_ds, ds], compat="override")
     return ds
 
+
+def _open_planned(paths: List[str], concat_dim: str = 'time') -> Tuple[xr.Dataset, dict]:
+    # Opens files lazily with each chunk within a single file, and returns the chunks planned for the combined
+    # dataset, so it is only rechunked once, when its final chunks are known
+    paths = sorted(paths)
+    with xr.open_dataset(paths[0]) as ds_first:
+        file_length = ds_first.sizes.get(concat_dim, 1)
+        chunks = plan_chunks(ds_first, file_length, len(paths), concat_dim=concat_dim)
+    ds = xr.open_mfdataset(paths, combine='by_coords', chunks=file_chunks(chunks, file_length, concat_dim))
+    return ds, chunks
+
+
+def _align_chunks(ds: xr.Dataset, chunks: dict, reference: xr.Dataset) -> xr.Dataset:
+    # Rechunks ds to its planned chunks, except dimensions of the same size as in reference take its chunks
+    chunks = dims_chunks(chunks, ds.dims)
+    chunks.update({dim: reference.chunksizes[dim] for dim in ds.dims
+                   if dim in reference.chunksizes and reference.sizes[dim] == ds.sizes[dim]})
+    return ds.chunk(chunks)
@@ -0,0 +1,153 @@
+import os
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Union, Tuple
+from ..utils.sqlite import sqlite_connect, sqlite_create
+
+ceda_cmip6_dir = '/badc/cmip6/data/CMIP6'
+# Directory levels of the CMIP6 DRS below ceda_cmip6_dir, the file is within the version directory
+DRS_FACETS = ['activity_id', 'institution_id', 'source_id', 'experiment_id', 'member_id', 'table_id',
+              'variable_id', 'grid_label', 'version']
+INDEX_COLUMNS = DRS_FACETS + ['path']
+
+
+class Ceda_index:
+    """
+    Persistent index of the CMIP6 files in the CEDA archive, saved as a local SQLite file.
+
+    The DRS directory tree `{activity}/{institution}/{source}/{experiment}/{member}/{table}/{variable}/{grid}/{version}`
+    is walked once with `refresh`, in parallel over institutions, and the facets of every file in the
+    `latest` version are recorded. `search` is then a single indexed query, rather than a `glob` over the archive
+    for every variable.
+
+    Examples:
+        ```
+        index = Ceda_index('/home/users/$USER/ceda_cmip6_index.sqlite')
+        index.refresh(activities=['CMIP', 'ScenarioMIP'])     # slow, only needs doing occasionally
+        index.search(source_id='MPI-ESM1-2-HR', experiment_id='historical', table_id='Amon', variable_id=['tas'])
+        ```
+    """
+    def __init__(self, index_file: str, data_dir: str = ceda_cmip6_dir):
+        """
+        Args:
+            index_file: Path to SQLite file in which to save the index. Will be created if does not exist.
+            data_dir: Directory containing the activity directories e.g. `CMIP/`.
+        """
+        self.path = data_dir
+        self.index_file = sqlite_create(index_file, [
+            f"CREATE TABLE IF NOT EXISTS files ({', '.join(f'{c} TEXT' for c in INDEX_COLUMNS)})",
+            "CREATE INDEX IF NOT EXISTS files_lookup ON files (source_id, experiment_id, table_id, variable_id)",
+            "CREATE INDEX IF NOT EXISTS files_scope ON files (activity_id, institution_id)"])
+
+    def refresh(self, activities: Optional[List[str]] = None, institutions: Optional[List[str]] = None,
+                max_workers: int = 16) -> int:
+        """
+        Walks the archive and replaces the index of every `(activity, institution)` directory walked.
+
+        Args:
+            activities: Only index these activities e.g. `['CMIP']`. If `None`, will index all activities.
+            institutions: Only index these institutions e.g. `['MPI-M']`. If `None`, will index all institutions.
+            max_workers: Number of institution directories walked concurrently.
+
+        Returns:
+            Number of files in the walked directories.
+        """
+        scopes = [(activity, institution) for activity in _list_subdirs(self.path)
+                  if activities is None or activity in activities
+                  for institution in _list_subdirs(os.path.join(self.path, activity))
+                  if institutions is None or institution in institutions]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            listings = executor.map(lambda scope: self._walk(*scope), scopes)
+            n_files = 0
+            # Each institution is replaced as soon as it is walked, so an interrupted refresh keeps its progress
+            for (activity, institution), records in zip(scopes, listings):
+                with sqlite_connect(self.index_file) as conn:
+                    conn.execute("DELETE FROM files WHERE activity_id = ? AND institution_id = ?",
+                                 (activity, institution))
+                    conn.executemany(f"INSERT INTO files VALUES ({', '.join('?' * len(INDEX_COLUMNS))})", records)
+                n_files += len(records)
+        return n_files
+
+    def _walk(self, activity: str, institution: str) -> List[Tuple[str, ...]]:
+        # Facets and path of every file in the latest version of each dataset of one institution
+        records = []
+        inst_dir = os.path.join(self.path, activity, institution)
+        for source in _list_subdirs(inst_dir):
+            for experiment in _list_subdirs(os.path.join(inst_dir, source)):
+                for member in _list_subdirs(os.path.join(inst_dir, source, experiment)):
+                    member_dir = os.path.join(inst_dir, source, experiment, member)
+                    for table in _list_subdirs(member_dir):
+                        for variable in _list_subdirs(os.path.join(member_dir, table)):
+                            for grid in _list_subdirs(os.path.join(member_dir, table, variable)):
+                                grid_dir = os.path.join(member_dir, table, variable, grid)
+                                version, version_dir = _latest_version(grid_dir)
+                                if version is None:
+                                    continue
+                                facets = (activity, institution, source, experiment, member, table, variable,
+                                          grid, version)
+                                records.extend(facets + (os.path.join(version_dir, name),)
+                                               for name in _list_files(version_dir, '.nc'))
+        return records
+
+    def search(self, **facets: Optional[Union[str, List[str]]]) -> pd.DataFrame:
+        """
+        Finds all files matching the given facets.
+
+        Args:
+            **facets: Value of any of the `DRS_FACETS` e.g. `source_id='MPI-ESM1-2-HR'`. Can be a list of values,
+                or a string containing `*` wildcards e.g. `member_id='r*i1p1f1'`. `None` or `*` matches anything.
+
+        Returns:
+            Table with a row for each file, and columns given by `INDEX_COLUMNS`.
+        """
+        conditions = []
+        values = []
+        for facet, value in facets.items():
+            if facet not in DRS_FACETS:
+                raise ValueError(f'Unknown facet {facet}, must be one of {DRS_FACETS}')
+            if value is None or value == '*':
+                continue
+            if isinstance(value, str):
+                conditions.append(f"{facet} GLOB ?")
+                values.append(value)
+            else:
+                value = list(value)
+                conditions.append(f"{facet} IN ({', '.join('?' * len(value))})")
+                values.extend(value)
+        query = "SELECT * FROM files"
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+        with sqlite_connect(self.index_file) as conn:
+            rows = conn.execute(query + " ORDER BY path", values).fetchall()
+        return pd.DataFrame(rows, columns=INDEX_COLUMNS)
+
+
+def _latest_version(grid_dir: str) -> Tuple[Optional[str], Optional[str]]:
+    # Name and directory of the latest version, which is the target of the latest link if there is one
+    latest_dir = os.path.join(grid_dir, 'latest')
+    if os.path.isdir(latest_dir):
+        if os.path.islink(latest_dir):
+            return os.path.basename(os.path.normpath(os.readlink(latest_dir))), latest_dir
+        return 'latest', latest_dir
+    versions = _list_subdirs(grid_dir)
+    if len(versions) == 0:
+        return None, None
+    return versions[-1], os.path.join(grid_dir, versions[-1])
+
+
+def _list_subdirs(path: str) -> List[str]:
+    # Sorted names of all directories in path, empty if path does not exist
+    try:
+        with os.scandir(path) as it:
+            return sorted(entry.name for entry in it if entry.is_dir())
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return []
+
+
+def _list_files(path: str, suffix: str) -> List[str]:
+    # Sorted names of all files in path ending in suffix
+    try:
+        with os.scandir(path) as it:
+            return sorted(entry.name for entry in it if entry.name.endswith(suffix) and not entry.is_dir())
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return []
@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import threading
+import warnings
+import urllib.error
+import urllib.request
+from typing import Optional, List, Dict
+
+cmip6_source_id_url = "https://raw.githubusercontent.com/WCRP-CMIP/CMIP6_CVs/main/CMIP6_source_id.json"
+default_cv_dir = '~/.cache/climdyn_tools/cmip6_cv'
+
+
+class Cmip6_cv:
+    """
+    CMIP6 `source_id` controlled vocabulary, with lookups precomputed when it is created so each is a
+    single dictionary access rather than a scan over all models.
+
+    Use `load_cv` to get the vocabulary, which is only read once per process and works without a network
+    once it has been downloaded.
+
+    Examples:
+        ```
+        cv = load_cv()
+        cv.sources_in_activity('CMIP')
+        cv.institution('MPI-ESM1-2-HR')
+        ```
+    """
+    def __init__(self, data: dict, etag: Optional[str] = None):
+        """
+        Args:
+            data: Parsed JSON from `CMIP6_source_id.json`.
+            etag: ETag of the downloaded JSON, used to check if it has changed.
+        """
+        self.data = data
+        self.etag = etag
+        self.version = data.get('version_metadata', {}).get('CV_collection_version')
+        self.activity_sources: Dict[str, List[str]] = {}
+        self.source_institution: Dict[str, Optional[str]] = {}
+        self.institution_sources: Dict[str, List[str]] = {}
+        for source_id, meta in data.get('source_id', {}).items():
+            for activity_id in meta.get('activity_participation', []):
+                self.activity_sources.setdefault(activity_id, []).append(source_id)
+            institutions = meta.get('institution_id', [None])
+            self.source_institution[source_id] = institutions[0] if len(institutions) > 0 else None
+            for institution_id in institutions:
+                self.institution_sources.setdefault(institution_id, []).append(source_id)
+
+    def sources_in_activity(self, activity_id: str) -> List[str]:
+        """
+        Args:
+            activity_id: e.g. "CMIP", "ScenarioMIP"
+
+        Returns:
+            List of source_id names that participate in the activity.
+        """
+        return list(self.activity_sources.get(activity_id, []))
+
+    def institution(self, source_id: str) -> Optional[str]:
+        """
+        Args:
+            source_id: e.g. "MPI-ESM1-2-HR"
+
+        Returns:
+            First listed institution_id of `source_id`, `None` if it is not in the vocabulary.
+        """
+        return self.source_institution.get(source_id)
+
+    def sources_of_institution(self, institution_id: str) -> List[str]:
+        """
+        Args:
+            institution_id: e.g. "MPI-M"
+
+        Returns:
+            List of source_id names listing `institution_id` as one of their institutions.
+        """
+        return list(self.institution_sources.get(institution_id, []))
+
+
+_cvs = {}
+_cvs_lock = threading.Lock()
+
+
+def load_cv(local_path: Optional[str] = None, cv_dir: Optional[str] = None, max_age_days: float = 30,
+            refresh: bool = False) -> Cmip6_cv:
+    """
+    Returns the CMIP6 `source_id` controlled vocabulary, which is only read once per process.
+
+    If `local_path` is not given, the JSON is saved in `cv_dir` with its ETag, and downloaded from GitHub again
+    only if it is older than `max_age_days` (or `refresh=True`) and has changed since. If GitHub cannot be
+    reached, e.g. on a compute node, the saved JSON is used whatever its age.
+
+    Args:
+        local_path: Path to local CMIP6_source_id.json, used instead of the saved JSON if it exists.
+        cv_dir: Directory in which to save the JSON. If `None`, will be `~/.cache/climdyn_tools/cmip6_cv/`.
+        max_age_days: Age of saved JSON after which to check if it has changed.
+        refresh: If `True`, will check if the JSON has changed, however old the saved JSON is.
+
+    Returns:
+        Controlled vocabulary.
+    """
+    if local_path is not None and os.path.exists(local_path):
+        key = os.path.abspath(local_path)
+    else:
+        local_path = None
+        key = os.path.abspath(os.path.expanduser(default_cv_dir if cv_dir is None else cv_dir))
+    with _cvs_lock:
+        if key not in _cvs or refresh:
+            if local_path is not None:
+                with open(local_path) as f:
+                    _cvs[key] = Cmip6_cv(json.load(f))
+            else:
+                _cvs[key] = _load_saved_cv(key, max_age_days, refresh)
+        return _cvs[key]
+
+
+def _load_saved_cv(cv_dir: str, max_age_days: float, refresh: bool) -> Cmip6_cv:
+    # Loads JSON saved in cv_dir, first downloading it if missing, or if old and changed on GitHub
+    json_file = os.path.join(cv_dir, 'CMIP6_source_id.json')
+    meta_file = os.path.join(cv_dir, 'CMIP6_source_id.meta.json')
+    meta = {}
+    if os.path.exists(json_file) and os.path.exists(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+    if len(meta) == 0 or refresh or time.time() - meta['checked'] > max_age_days * 86400:
+        request = urllib.request.Request(cmip6_source_id_url)
+        if meta.get('etag') is not None:
+            request.add_header('If-None-Match', meta['etag'])
+        try:
+            with urllib.request.urlopen(request, timeout=30) as f:
+                content = f.read()
+                etag = f.headers.get('ETag')
+            data = json.loads(content)
+            os.makedirs(cv_dir, exist_ok=True)
+            _write_atomic(json_file, content)
+            meta = {'etag': etag, 'version': data.get('version_metadata', {}).get('CV_collection_version')}
+            checked = True
+        except (urllib.error.URLError, OSError) as e:
+            if isinstance(e, urllib.error.HTTPError) and e.code == 304 and len(meta) > 0:
+                checked = True      # not modified, so saved JSON is up to date
+            elif len(meta) == 0:
+                raise RuntimeError(f"Could not download {cmip6_source_id_url} and no saved copy in {cv_dir}, "
+                                   f"provide local_path instead") from e
+            else:
+                # Not recorded as checked, so the next run with a network checks again
+                checked = False
+                warnings.warn(f"Could not check for updates of the CMIP6 CV, using saved copy from {cv_dir}\n{e}")
+        if checked:
+            meta['checked'] = time.time()
+            _write_atomic(meta_file, json.dumps(meta).encode())
+    with open(json_file) as f:
+        return Cmip6_cv(json.load(f), meta.get('etag'))
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    # Writes to a temporary file first, so a failed write never leaves a partial file
+    tmp_file = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_file, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_file, path)
@@ -0,0 +1,191 @@
+import os
+import copy
+import json
+import time
+import pickle
+import random
+import hashlib
+import threading
+from intake_esgf import ESGFCatalog
+from typing import Optional, Callable, Any, TypeVar
+from ..utils.sqlite import sqlite_connect, sqlite_create
+
+default_search_cache_dir = '~/.cache/climdyn_tools/esgf_searches'
+T = TypeVar('T')
+
+
+def retry_with_backoff(func: Callable[[], T], max_attempts: int = 20, deadline: float = 600,
+                       base_delay: float = 1, max_delay: float = 60, description: str = 'ESGFCatalog') -> T:
+    """
+    Calls `func` until it succeeds, waiting longer after each failure.
+
+    The wait after the n-th failure is random between 0 and `min(max_delay, base_delay * 2**n)` seconds
+    (exponential backoff with full jitter), so many processes retrying at once do not all retry together.
+    No wait goes past `deadline`.
+
+    Args:
+        func: Function to call, with no arguments.
+        max_attempts: Maximum number of times to call `func`.
+        deadline: Maximum total time in seconds, after which no more attempts are made.
+        base_delay: Maximum wait in seconds after the first failure.
+        max_delay: Maximum wait in seconds after any failure.
+        description: What `func` does, used in the printed messages.
+
+    Returns:
+        Output of `func`.
+
+    Raises:
+        RuntimeError: If `func` does not succeed within `max_attempts` or `deadline`.
+    """
+    end_time = time.monotonic() + deadline
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return func()
+        except Exception as e:
+            remaining = end_time - time.monotonic()
+            if attempt == max_attempts or remaining <= 0:
+                raise RuntimeError(f"{description} failed after {attempt} attempts") from e
+            wait_time = min(random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1))), remaining)
+            print(f"[Attempt {attempt}] {description} failed: {e}\nRetrying in {wait_time:.1f} seconds...")
+            time.sleep(wait_time)
+
+
+def search_key(facets: dict) -> str:
+    """
+    Args:
+        facets: Search facets e.g. `{'source_id': ['NorESM2-LM'], 'table_id': 'Amon'}`.
+
+    Returns:
+        Key identifying the search, the same whatever the order of the facets or of the values of each facet,
+            and whether a single value is given as a string or a list.
+    """
+    normalised = {k: sorted(str(x) for x in ([v] if isinstance(v, (str, bool, int, float)) else v))
+                  for k, v in facets.items() if v is not None}
+    return hashlib.sha1(json.dumps(normalised, sort_keys=True).encode()).hexdigest()
+
+
+class Esgf_session:
+    """
+    Reusable `ESGFCatalog`, with a local cache of search results.
+
+    The catalog is only initialised once, retrying with `retry_with_backoff` if this fails, and each search
+    is done with a shallow copy of it, so shares its indices and connections. The results of each search are
+    saved in a SQLite file, and the same search (whatever the order of its facets) within `ttl_hours` is
+    served from there without contacting ESGF.
+
+    Use `get_session` to share a session between all functions in a process.
+
+    Examples:
+        ```
+        session = get_session()
+        cat = session.search(source_id=['NorESM2-LM'], experiment_id=['historical'], variable_id=['tas'],
+                             table_id='Amon')      # slow the first time, read from cache afterwards
+        cat.df
+        ```
+    """
+    def __init__(self, cache_dir: Optional[str] = None, ttl_hours: float = 24,
+                 catalog_factory: Callable[[], Any] = ESGFCatalog, max_attempts: int = 20, deadline: float = 600):
+        """
+        Args:
+            cache_dir: Directory in which to save search results. If `None`, will be
+                `~/.cache/climdyn_tools/esgf_searches/`.
+            ttl_hours: Time in hours for which a search result is used before searching again.
+                If `0`, search results are not cached.
+            catalog_factory: Function returning a new catalog, with a `search` method setting a `df` attribute.
+                Can be replaced by a local stand-in for testing.
+            max_attempts: Maximum number of attempts to initialise the catalog.
+            deadline: Maximum total time in seconds to spend initialising the catalog.
+        """
+        cache_dir = default_search_cache_dir if cache_dir is None else cache_dir
+        self.cache_dir = os.path.expandvars(os.path.expanduser(cache_dir))
+        self.ttl = ttl_hours * 3600
+        self.catalog_factory = catalog_factory
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self._catalog = None
+        self._lock = threading.Lock()
+        self.db_file = os.path.join(self.cache_dir, 'searches.sqlite')
+        if self.ttl > 0:
+            sqlite_create(self.db_file, ["CREATE TABLE IF NOT EXISTS searches (key TEXT PRIMARY KEY, facets TEXT, "
+                                         "created REAL, df BLOB)"])
+
+    def catalog(self) -> ESGFCatalog:
+        """
+        Returns:
+            Empty catalog ready for a search, sharing the indices of the session catalog,
+                which is initialised the first time this is called.
+        """
+        with self._lock:
+            if self._catalog is None:
+                self._catalog = retry_with_backoff(self.catalog_factory, self.max_attempts, self.deadline)
+        cat = copy.copy(self._catalog)
+        cat.df = None
+        if hasattr(cat, 'last_search'):
+            cat.last_search = {}
+        return cat
+
+    def search(self, **facets) -> ESGFCatalog:
+        """
+        Searches ESGF, using a cached result of the same search if there is one within `ttl_hours`.
+
+        Args:
+            **facets: Search facets as passed to `ESGFCatalog.search` e.g. `source_id=['NorESM2-LM']`.
+
+        Returns:
+            Catalog with the results of the search in `df`.
+        """
+        key = search_key(facets)
+        cat = self.catalog()
+        if self.ttl > 0:
+            with sqlite_connect(self.db_file) as conn:
+                row = conn.execute("SELECT created, df FROM searches WHERE key = ?", (key,)).fetchone()
+            if row is not None and time.time() - row[0] < self.ttl:
+                cat.df = pickle.loads(row[1])
+                if hasattr(cat, '_set_project'):
+                    cat._set_project()
+                if hasattr(cat, 'last_search'):
+                    cat.last_search = facets
+                return cat
+        if isinstance(cat, ESGFCatalog):
+            cat.search(quiet=True, **facets)
+        else:
+            cat.search(**facets)
+        if self.ttl > 0:
+            with sqlite_connect(self.db_file) as conn:
+                conn.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)",
+                             (key, json.dumps(facets, default=str), time.time(), pickle.dumps(cat.df)))
+        return cat
+
+    def clear(self) -> None:
+        """
+        Deletes all cached search results.
+        """
+        if self.ttl > 0:
+            with sqlite_connect(self.db_file) as conn:
+                conn.execute("DELETE FROM searches")
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(cache_dir: Optional[str] = None, ttl_hours: float = 24,
+                catalog_factory: Callable[[], Any] = ESGFCatalog) -> Esgf_session:
+    """
+    Returns the session of the process with these arguments, creating it the first time, so the catalog is only
+    initialised once per process.
+
+    Args:
+        cache_dir: Directory in which to save search results. If `None`, will be
+            `~/.cache/climdyn_tools/esgf_searches/`.
+        ttl_hours: Time in hours for which a search result is used before searching again.
+        catalog_factory: Function returning a new catalog.
+
+    Returns:
+        Shared session.
+    """
+    key = (cache_dir, ttl_hours, catalog_factory)
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = Esgf_session(cache_dir, ttl_hours, catalog_factory)
+        return _sessions[key]
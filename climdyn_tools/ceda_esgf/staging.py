@@ -0,0 +1,189 @@
+import os
+import hashlib
+import requests
+import pathlib
+import intake_esgf
+from intake_esgf import ESGFCatalog
+try:
+    from intake_esgf.base import get_local_file
+except ImportError:
+    get_local_file = None       # internal to intake_esgf, stage_catalog uses to_path_dict if missing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any
+
+
+def default_staging_dir() -> str:
+    """
+    Returns:
+        First local cache directory of `intake_esgf`, so files staged here are also found by `intake_esgf`.
+    """
+    return os.path.expanduser(intake_esgf.conf['local_cache'][0])
+
+
+def file_checksum(path: str, checksum_type: str = 'sha256', block_size: int = 2 ** 20) -> str:
+    """
+    Args:
+        path: Path to file.
+        checksum_type: Hash algorithm e.g. `sha256` or `md5`.
+        block_size: Number of bytes read at a time.
+
+    Returns:
+        Hex digest of the file.
+    """
+    hasher = hashlib.new(checksum_type.lower())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def download_resumable(url: str, path: str, size: Optional[int] = None, checksum: Optional[str] = None,
+                       checksum_type: Optional[str] = None, timeout: float = 60, block_size: int = 2 ** 20) -> str:
+    """
+    Downloads `url` to `path`, continuing from where a previous interrupted download stopped.
+
+    Data are written to `{path}.part`, which is only moved to `path` once it is complete and its checksum matches.
+    If the server does not support range requests, the download starts again from the beginning.
+
+    Args:
+        url: URL of file.
+        path: Where to save the file.
+        size: Expected size of the file in bytes, if known.
+        checksum: Expected checksum of the file, if known.
+        checksum_type: Hash algorithm of `checksum` e.g. `sha256`.
+        timeout: Seconds to wait for the server to respond.
+        block_size: Number of bytes written at a time.
+
+    Returns:
+        `path`.
+
+    Raises:
+        ValueError: If the size or checksum of the downloaded file is not as expected,
+            in which case the partial file is deleted.
+    """
+    part_file = f"{path}.part"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    if size is None or offset < size:
+        headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+        with requests.get(url, stream=True, timeout=timeout, headers=headers) as response:
+            if response.status_code == 416:         # requested range not satisfiable, so start again
+                os.remove(part_file)
+                return download_resumable(url, path, size, checksum, checksum_type, timeout, block_size)
+            response.raise_for_status()
+            # 206 means the server sent only the rest of the file, otherwise it sent the whole file
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            with open(part_file, mode) as f:
+                for block in response.iter_content(chunk_size=block_size):
+                    f.write(block)
+    part_size = os.path.getsize(part_file)
+    if size is not None and part_size != size:
+        os.remove(part_file)
+        raise ValueError(f"Size of {url} is {part_size}, expected {size}")
+    if checksum is not None and checksum_type is not None:
+        if file_checksum(part_file, checksum_type) != checksum.lower():
+            os.remove(part_file)
+            raise ValueError(f"Checksum of {url} does not match {checksum_type} {checksum}")
+    os.replace(part_file, path)
+    return path
+
+
+def stage_file(info: Dict[str, Any], staging_dir: str, timeout: float = 60) -> str:
+    """
+    Makes sure a single file is in `staging_dir`, downloading it from the first URL which works if not.
+
+    Args:
+        info: File information as returned by `ESGFCatalog._get_file_info`, with keys `path` (relative path of the
+            file), `HTTPServer` (list of URLs), `size`, `checksum` and `checksum_type`.
+        staging_dir: Directory in which files are saved, at their relative `path`.
+        timeout: Seconds to wait for a server to respond.
+
+    Returns:
+        Path of the staged file.
+
+    Raises:
+        RuntimeError: If the file could not be downloaded from any URL.
+    """
+    path = os.path.join(staging_dir, str(info['path']))
+    if os.path.exists(path) and (info.get('size') is None or os.path.getsize(path) == info['size']):
+        return path         # already staged, only complete verified files are moved to path
+    errors = []
+    for url in info.get('HTTPServer', []):
+        try:
+            return download_resumable(url, path, info.get('size'), info.get('checksum'), info.get('checksum_type'),
+                                      timeout)
+        except (requests.RequestException, ValueError, OSError) as e:
+            errors.append(f"{url}: {e}")
+    raise RuntimeError(f"Could not download {info['path']}\n" + "\n".join(errors))
+
+
+def stage_files(infos: List[Dict[str, Any]], staging_dir: Optional[str] = None, max_workers: int = 8,
+                timeout: float = 60) -> Dict[str, List[str]]:
+    """
+    Downloads files concurrently into `staging_dir`, skipping those already there.
+
+    Args:
+        infos: Information of each file as returned by `ESGFCatalog._get_file_info`.
+        staging_dir: Directory in which to save files. If `None`, will be the `intake_esgf` local cache.
+        max_workers: Number of files downloaded at the same time.
+        timeout: Seconds to wait for a server to respond.
+
+    Returns:
+        Dictionary with a key for each dataset (the `key` of each file information), and values given by
+            the sorted paths of its staged files.
+    """
+    staging_dir = default_staging_dir() if staging_dir is None else os.path.expanduser(staging_dir)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        paths = list(executor.map(lambda info: stage_file(info, staging_dir, timeout), infos))
+    datasets = {}
+    for info, path in zip(infos, paths):
+        datasets.setdefault(info['key'], []).append(path)
+    return {key: sorted(paths) for key, paths in datasets.items()}
+
+
+def stage_catalog(cat: ESGFCatalog, staging_dir: Optional[str] = None, max_workers: int = 8, timeout: float = 60,
+                  quiet: bool = True) -> Dict[str, List[str]]:
+    """
+    Finds the files of all datasets in a catalog, as `ESGFCatalog.to_path_dict` does, but downloads them
+    with `stage_files`.
+
+    As with `to_path_dict`, files already in one of the `esg_dataroot` or `local_cache` directories of `cat` are
+    read in place rather than downloaded, and if `intake_esgf.conf['confirm_download']` is set, the download
+    must be confirmed first.
+
+    This uses functions internal to `intake_esgf`, so if a version without them is installed,
+    `to_path_dict` is used instead.
+
+    Args:
+        cat: Catalog with search results in `df`.
+        staging_dir: Directory in which to save files. If `None`, will be the `intake_esgf` local cache.
+        max_workers: Number of files downloaded at the same time.
+        timeout: Seconds to wait for a server to respond.
+        quiet: If `False`, will print the download size and show progress of getting the file information.
+
+    Returns:
+        Dictionary with a key for each dataset, and values given by the sorted paths of its files.
+            Empty if the download was cancelled.
+    """
+    if get_local_file is None or not hasattr(cat, '_get_file_info'):
+        return {key: sorted(str(path) for path in paths)
+                for key, paths in cat.to_path_dict(prefer_streaming=False, quiet=quiet).items()}
+    dataroots = [pathlib.Path(path) for path in getattr(cat, 'esg_dataroot', []) + getattr(cat, 'local_cache', [])]
+    datasets = {}
+    missing = []
+    for info in cat._get_file_info(quiet=quiet):
+        try:
+            datasets.setdefault(info['key'], []).append(str(get_local_file(pathlib.Path(info['path']), dataroots)))
+        except FileNotFoundError:
+            missing.append(info)
+    if len(missing) > 0:
+        download_size = sum(info.get('size') or 0 for info in missing) * 1e-6
+        if not quiet:
+            print(f"Downloading {len(missing)} files, {download_size:.1f} Mb...")
+        if intake_esgf.conf.get('confirm_download', False):
+            if input("Proceed with download? [y/N]: ").strip().lower() not in ('y', 'yes'):
+                print("Download cancelled.")
+                return {}
+        for key, paths in stage_files(missing, staging_dir, max_workers, timeout).items():
+            datasets.setdefault(key, []).extend(paths)
+    return {key: sorted(paths) for key, paths in datasets.items()}
@@ -1 +1 @@
-from .load import load_dataset
\ No newline at end of file
+from .load import load_dataset, load_ensemble
\ No newline at end of file
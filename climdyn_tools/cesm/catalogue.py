@@ -0,0 +1,129 @@
+import os
+import re
+import warnings
+import numpy as np
+import pandas as pd
+import xarray as xr
+import cftime
+from typing import Optional, List, Union
+from xarray.coding.cftimeindex import CFTimeIndex
+from pandas._libs.tslibs.np_datetime import OutOfBoundsDatetime
+
+CATALOGUE_COLUMNS = ['path', 'hist_file', 'year', 'month', 'day', 'seconds']
+# Cumulative number of days before the start of each month in a noleap year
+_NOLEAP_MONTH_START = np.concatenate(([0], np.cumsum([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])))
+
+
+class Hist_catalogue:
+    """
+    Table of all history files of one component of a CESM experiment, built from a single listing of the
+    `hist` directory.
+
+    The date in each file name e.g. `exp.cam.h1.0001-01-01-00000.nc` is parsed for all files at once,
+    so selecting files by year or month is a boolean mask over the table rather than a loop over files.
+
+    Examples:
+        ```
+        catalogue = Hist_catalogue(hist_dir, 'exp', 'cam')
+        catalogue.select(hist_file=0, years=[1, 2], months=[6, 7, 8])['path']
+        ```
+    """
+    def __init__(self, hist_dir: str, exp_name: str, comp_id: str, stat: bool = False):
+        """
+        Args:
+            hist_dir: Directory containing the history files e.g. `{archive_dir}/{exp_name}/atm/hist`.
+            exp_name: Name of experiment, which is the start of each file name.
+            comp_id: String indicating the component in each file name e.g. `cam`.
+            stat: If `True`, `table` will also have columns `size` (bytes) and `mtime` of each file.
+        """
+        self.hist_dir = hist_dir
+        self.exp_name = exp_name
+        self.comp_id = comp_id
+        with os.scandir(hist_dir) as it:
+            entries = list(it)
+        names = pd.Series([entry.name for entry in entries], dtype=object)
+        self.table = self.parse_file_names(names)
+        if stat:
+            entries = {entry.name: entry for entry in entries}
+            stats = [entries[os.path.basename(path)].stat() for path in self.table['path']]
+            self.table['size'] = np.array([st.st_size for st in stats], dtype=np.int64)
+            self.table['mtime'] = np.array([st.st_mtime for st in stats], dtype=float)
+
+    def parse_file_names(self, names: pd.Series) -> pd.DataFrame:
+        """
+        Args:
+            names: Name of every file in `hist_dir`.
+
+        Returns:
+            Table with columns `path`, `hist_file`, `year`, `month`, `day` and `seconds`, with a row for each
+                history file of the experiment and component, sorted by `hist_file` then date.
+                For monthly files named `YYYY-MM`, `day` is 1 and `seconds` is 0.
+        """
+        pattern = (rf'^{re.escape(self.exp_name)}\.{re.escape(self.comp_id)}\.h(?P<hist_file>\d+)\.'
+                   r'(?P<year>\d{4,})-(?P<month>\d{2})(?:-(?P<day>\d{2})(?:-(?P<seconds>\d{5}))?)?\.nc$')
+        info = names.str.extract(pattern)
+        keep = info['hist_file'].notna().to_numpy()
+        info = info[keep].fillna({'day': '1', 'seconds': '0'}).astype(np.int64)
+        info.insert(0, 'path', [os.path.join(self.hist_dir, name) for name in names[keep]])
+        return info.sort_values(CATALOGUE_COLUMNS[1:] + ['path']).reset_index(drop=True)[CATALOGUE_COLUMNS]
+
+    def select(self, hist_file: int = 0, years: Optional[Union[List[int], np.ndarray]] = None,
+               months: Optional[Union[List[int], np.ndarray]] = None) -> pd.DataFrame:
+        """
+        Args:
+            hist_file: Which history file to select.
+            years: Only keep files with these years in their name. If `None`, will keep all years.
+            months: Only keep files with these months (1 is Jan) in their name. If `None`, will keep all months.
+
+        Returns:
+            Rows of `table` for the selected files.
+        """
+        mask = self.table['hist_file'].to_numpy() == hist_file
+        if years is not None:
+            mask &= np.isin(self.table['year'].to_numpy(), years)
+        if months is not None:
+            mask &= np.isin(self.table['month'].to_numpy(), months)
+        return self.table[mask]
+
+    def years(self, hist_file: int = 0) -> List[int]:
+        """
+        Args:
+            hist_file: Which history file to consider.
+
+        Returns:
+            Sorted list of all years in the names of the `hist_file` files.
+        """
+        return np.unique(self.select(hist_file)['year']).tolist()
+
+    def months(self, hist_file: int = 0) -> List[int]:
+        """
+        Args:
+            hist_file: Which history file to consider.
+
+        Returns:
+            Sorted list of all months in the names of the `hist_file` files.
+        """
+        return np.unique(self.select(hist_file)['month']).tolist()
+
+    def dates(self, hist_file: int = 0) -> xr.DataArray:
+        """
+        Args:
+            hist_file: Which history file to consider.
+
+        Returns:
+            DataArray of dates (to the nearest day) in the names of the `hist_file` files.
+                If outside the range of `datetime64[ns]`, the dates will use the `noleap` calendar.
+        """
+        table = self.select(hist_file)
+        year = table['year'].to_numpy()
+        month = table['month'].to_numpy()
+        day = table['day'].to_numpy()
+        dates = ((year - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1).astype('timedelta64[M]')
+                 ).astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+        try:
+            return xr.DataArray(dates, dims="time", name="time")
+        except OutOfBoundsDatetime as e:
+            warnings.warn(f"Got out of bounds error, re-trying with NoLeap Calendar and cftime\n{e}")
+            days = (year - 1) * 365 + _NOLEAP_MONTH_START[month - 1] + day - 1
+            cftime_dates = cftime.num2date(days, 'days since 0001-01-01', calendar='noleap')
+            return xr.DataArray(CFTimeIndex(cftime_dates, calendar="noleap"), dims="time", name="time")
@@ -0,0 +1,239 @@
+import os
+import hashlib
+import contextlib
+import logging
+import pandas as pd
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Callable
+from ..utils.ds_slicing import area_weighting
+from ..utils.sqlite import sqlite_connect, sqlite_create
+from .catalogue import Hist_catalogue
+from .load import get_exp_dir, jasmin_archive_dir, _month_shift_preprocess
+
+default_store_dir = '~/.cache/climdyn_tools/cesm_diagnostics'
+
+
+class Diagnostics_store:
+    """
+    Local store of diagnostics of a CESM experiment, computed separately for each history file so that
+    while the experiment is running, only history files which are new since the last `update` need to be processed.
+
+    Each diagnostic is a function taking the dataset of a single history file and returning a small dataset
+    which keeps the `time` dimension e.g. a global or zonal mean. The result for each file is saved as a NetCDF file
+    in `store_dir`, and the size and modification time of the history file are recorded in a SQLite file.
+    A history file is processed again if it has changed, and its results are deleted if it is removed.
+    Results of diagnostics which are no longer given are kept, unless deleted with `prune_diagnostics`.
+
+    Diagnostics are identified by name, so if the function of a diagnostic changes, it should be given a
+    new name or passed to `recompute` in `update`.
+
+    Examples:
+        ```
+        store = Diagnostics_store('exp', {'global_mean': global_mean(['TREFHT']),
+                                          'zonal_mean': zonal_mean(['T', 'U'])})
+        store.update()      # only processes files added since the last update
+        ds = store.load('zonal_mean')
+        ```
+    """
+    def __init__(self, exp_name: str, diagnostics: Dict[str, Callable[[xr.Dataset], xr.Dataset]],
+                 comp: str = 'atm', archive_dir: str = jasmin_archive_dir, hist_file: int = 0,
+                 store_dir: Optional[str] = None, apply_month_shift_fix: bool = True):
+        """
+        Args:
+            exp_name: Name of folder in `archive_dir` where data for this experiment was saved.
+            diagnostics: Dictionary with a key for the name of each diagnostic, and value given by the function
+                computing it from the dataset of a single history file.
+            comp: Component of CESM to load data from e.g. `atm`.
+            archive_dir: Directory where CESM archive data saved.
+            hist_file: Which history file to compute diagnostics of.
+            store_dir: Directory in which to save the results. Will be created if does not exist.
+                If `None`, will be in `~/.cache/climdyn_tools/cesm_diagnostics/`.
+            apply_month_shift_fix: If `True`, will apply `ds_month_shift` to each file before computing
+                diagnostics. Only used for monthly averaged data i.e. `hist_file=0`.
+        """
+        self.exp_name = exp_name
+        self.diagnostics = diagnostics
+        self.hist_dir, self.comp_id = get_exp_dir(exp_name, comp, archive_dir)
+        self.hist_dir = os.path.abspath(self.hist_dir)
+        self.hist_file = hist_file
+        self.apply_month_shift_fix = apply_month_shift_fix and hist_file == 0
+        if store_dir is None:
+            hist_dir_hash = hashlib.sha1(self.hist_dir.encode()).hexdigest()[:10]
+            store_dir = os.path.join(default_store_dir, f"{exp_name}.{self.comp_id}.h{hist_file}.{hist_dir_hash}")
+        self.store_dir = os.path.expandvars(os.path.expanduser(store_dir))
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.db_file = sqlite_create(os.path.join(self.store_dir, 'store.sqlite'), [
+            "CREATE TABLE IF NOT EXISTS results (name TEXT, diagnostic TEXT, year INTEGER, "
+            "month INTEGER, day INTEGER, seconds INTEGER, size INTEGER, mtime REAL, "
+            "PRIMARY KEY (name, diagnostic))"])
+
+    def result_file(self, diagnostic: str, name: str) -> str:
+        """
+        Args:
+            diagnostic: Name of diagnostic.
+            name: Name of history file.
+
+        Returns:
+            Path of the NetCDF file containing the result of `diagnostic` for the history file `name`.
+        """
+        return os.path.join(self.store_dir, diagnostic, name)
+
+    def update(self, max_workers: int = 4, recompute: Optional[List[str]] = None,
+               logger: Optional[logging.Logger] = None) -> int:
+        """
+        Computes all diagnostics for history files which are new or have changed since the last update,
+        and deletes results of history files which no longer exist.
+
+        Args:
+            max_workers: Number of history files processed concurrently.
+            recompute: Diagnostics to compute again for all history files e.g. because their function has changed.
+            logger: Optional logger.
+
+        Returns:
+            Number of history files processed.
+        """
+        recompute = [] if recompute is None else recompute
+        table = Hist_catalogue(self.hist_dir, self.exp_name, self.comp_id, stat=True).select(self.hist_file)
+        table = table.reset_index(drop=True).assign(name=[os.path.basename(path) for path in table['path']])
+        with sqlite_connect(self.db_file) as conn:
+            known = pd.DataFrame(conn.execute("SELECT name, diagnostic, size, mtime FROM results").fetchall(),
+                                 columns=['name', 'diagnostic', 'size_known', 'mtime_known'])
+        # Results of diagnostics not in self.diagnostics are kept, they are only deleted by prune_diagnostics
+        self._delete_results(known[~known['name'].isin(table['name'])])
+
+        # Diagnostics to compute for each history file, so each file is only opened once
+        pending = {}
+        for diagnostic in self.diagnostics:
+            table_diag = table.merge(known[known['diagnostic'] == diagnostic], on='name', how='left')
+            todo = ((table_diag['size'] != table_diag['size_known']) |
+                    (table_diag['mtime'] != table_diag['mtime_known']) | (diagnostic in recompute))
+            for row in table_diag[todo.to_numpy()].itertuples():
+                pending.setdefault(row.Index, []).append(diagnostic)
+        if logger:
+            logger.info(f'Computing diagnostics of {len(pending)} new or changed files of {self.exp_name}')
+        for diagnostic in self.diagnostics:
+            os.makedirs(os.path.join(self.store_dir, diagnostic), exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda item: self._process_file(table.loc[item[0], 'path'], item[1]),
+                                   pending.items())
+            # Recorded as each file finishes, so an interrupted update keeps the files already processed
+            for (i, diagnostics), _ in zip(pending.items(), results):
+                row = table.loc[i]
+                with sqlite_connect(self.db_file) as conn:
+                    conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     [(row['name'], diagnostic, int(row['year']), int(row['month']), int(row['day']),
+                                       int(row['seconds']), int(row['size']), float(row['mtime']))
+                                      for diagnostic in diagnostics])
+                if logger:
+                    logger.info(f'Computed {diagnostics} for {row["name"]}')
+        return len(pending)
+
+    def prune_diagnostics(self) -> List[str]:
+        """
+        Deletes all saved results of diagnostics which are not in `diagnostics` of this store,
+        e.g. those of a diagnostic which has been renamed.
+
+        Returns:
+            Names of the diagnostics whose results were deleted.
+        """
+        with sqlite_connect(self.db_file) as conn:
+            known = pd.DataFrame(conn.execute("SELECT name, diagnostic FROM results").fetchall(),
+                                 columns=['name', 'diagnostic'])
+        removed = known[~known['diagnostic'].isin(list(self.diagnostics))]
+        self._delete_results(removed)
+        return sorted(removed['diagnostic'].unique())
+
+    def _delete_results(self, removed: pd.DataFrame) -> None:
+        # Deletes result files and records of each (name, diagnostic) row in removed
+        for row in removed.itertuples():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.result_file(row.diagnostic, row.name))
+        with sqlite_connect(self.db_file) as conn:
+            conn.executemany("DELETE FROM results WHERE name = ? AND diagnostic = ?",
+                             list(zip(removed['name'], removed['diagnostic'])))
+
+    def _process_file(self, path: str, diagnostics: List[str]) -> None:
+        # Computes diagnostics of a single history file, writing each to a temporary file first so a
+        # failed write never leaves a partial result in the store
+        with xr.open_dataset(path, decode_times=not self.apply_month_shift_fix) as ds:
+            if self.apply_month_shift_fix:
+                ds = _month_shift_preprocess(ds)
+            for diagnostic in diagnostics:
+                result = self.diagnostics[diagnostic](ds).load()
+                if isinstance(result, xr.DataArray):
+                    result = result.to_dataset(name=diagnostic)
+                out_file = self.result_file(diagnostic, os.path.basename(path))
+                tmp_file = f"{out_file}.tmp-{os.getpid()}-{id(result)}"
+                result.to_netcdf(tmp_file)
+                os.replace(tmp_file, out_file)
+
+    def files(self, diagnostic: str) -> List[str]:
+        """
+        Args:
+            diagnostic: Name of diagnostic.
+
+        Returns:
+            Result files of `diagnostic` in the store, sorted by the date of the history file.
+        """
+        with sqlite_connect(self.db_file) as conn:
+            names = conn.execute("SELECT name FROM results WHERE diagnostic = ? ORDER BY year, month, day, seconds, "
+                                 "name", (diagnostic,)).fetchall()
+        return [self.result_file(diagnostic, name) for name, in names]
+
+    def load(self, diagnostic: str, max_workers: int = 8) -> xr.Dataset:
+        """
+        Combines the results of `diagnostic` for all history files along `time`.
+
+        Args:
+            diagnostic: Name of diagnostic.
+            max_workers: Number of result files read concurrently.
+
+        Returns:
+            Dataset of the diagnostic over the whole experiment, loaded into memory.
+        """
+        files = self.files(diagnostic)
+        if len(files) == 0:
+            raise ValueError(f'No results of {diagnostic} in the store, call update first')
+
+        def read(path: str) -> xr.Dataset:
+            with xr.open_dataset(path) as ds:
+                return ds.load()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            ds_files = list(executor.map(read, files))
+        return xr.concat(ds_files, dim='time', data_vars='minimal', coords='minimal', compat='override')
+
+
+def global_mean(variables: Optional[List[str]] = None) -> Callable[[xr.Dataset], xr.Dataset]:
+    """
+    Args:
+        variables: Variables to average. If `None`, will be all variables with `lat` and `lon` dimensions.
+
+    Returns:
+        Function computing the area weighted mean over `lat` and `lon` of each of `variables`,
+            for use as a diagnostic of `Diagnostics_store`.
+    """
+    def diagnostic(ds: xr.Dataset) -> xr.Dataset:
+        return area_weighting(ds[_horizontal_variables(ds, variables)]).mean(dim=['lat', 'lon'])
+    return diagnostic
+
+
+def zonal_mean(variables: Optional[List[str]] = None) -> Callable[[xr.Dataset], xr.Dataset]:
+    """
+    Args:
+        variables: Variables to average. If `None`, will be all variables with `lat` and `lon` dimensions.
+
+    Returns:
+        Function computing the mean over `lon` of each of `variables`, for use as a diagnostic of `Diagnostics_store`.
+    """
+    def diagnostic(ds: xr.Dataset) -> xr.Dataset:
+        return ds[_horizontal_variables(ds, variables)].mean(dim='lon')
+    return diagnostic
+
+
+def _horizontal_variables(ds: xr.Dataset, variables: Optional[List[str]]) -> List[str]:
+    # variables if given, otherwise all data variables on the lat-lon grid
+    if variables is not None:
+        return list(variables)
+    return [name for name, var in ds.data_vars.items() if 'lat' in var.dims and 'lon' in var.dims]
@@ -1,20 +1,24 @@
 import os
+import glob
+import time
 import xarray as xr
-import cftime
-from typing import Optional, List, Union, Literal, Callable
-import fnmatch
+import pandas as pd
+from typing import Optional, List, Union, Literal, Callable, Tuple
 import numpy as np
 import warnings
 import logging
-import re
+from functools import partial, lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from ..utils.base import parse_int_list
 from ..utils.constants import g
 from ..utils.xarray import set_attrs
-from xarray.coding.cftimeindex import CFTimeIndex
-from pandas._libs.tslibs.np_datetime import OutOfBoundsDatetime
+from ..utils.chunking import plan_chunks, file_chunks, dims_chunks
+from .catalogue import Hist_catalogue
+from .manifest import Exp_manifest
 
 jasmin_archive_dir = '/gws/nopw/j04/global_ex/$USER/cesm/CESM2.1.3/archive/'
+hybrid_coef_vars = ['hyam', 'hybm', 'hyai', 'hybi', 'P0']     # needed to compute pressure on model levels
 jasmin_surf_geopotential_file = ('/gws/nopw/j04/global_ex/jamd1/cesm/CESM2.1.3/cesm_inputdata/atm/cam/topo/'
                                  'fv_0.9x1.25_nc3000_Nsw042_Nrs008_Co060_Fi001_ZR_sgh30_24km_GRNL_c170103.nc')
 
@@ -22,7 +26,7 @@ jasmin_surf_geopotential_file = ('/gws/nopw/j04/global_ex/jamd1/cesm/CESM2.1.3/c
 def load_dataset(exp_name: str, comp: str = 'atm',
                  archive_dir: str = jasmin_archive_dir,
                  hist_file: int = 0,
-                 chunks: Optional[Union[dict, Literal["auto"], int]] = None,
+                 chunks: Optional[Union[dict, Literal["auto", "plan"], int]] = None,
                  combine: Literal["by_coords", "nested"] = 'nested',
                  concat_dim: str = 'time',
                  decode_times: bool = True,
@@ -31,6 +35,9 @@ def load_dataset(exp_name: str, comp: str = 'atm',
                  year_files: Optional[Union[int, List, str]] = None,
                  month_files: Optional[Union[int, List, str]] = None,
                  apply_month_shift_fix: bool = True,
+                 manifest: Union[bool, str] = False,
+                 reference_file: Optional[str] = None,
+                 variables: Optional[List[str]] = None,
                  logger: Optional[logging.Logger] = None) -> xr.Dataset:
     """
     This loads a dataset of a given component produced by CESM.
@@ -48,7 +55,9 @@ def load_dataset(exp_name: str, comp: str = 'atm',
         hist_file: Which history file to load, `0` is the default monthly averaged data set.
         chunks: Dictionary with keys given by dimension names and values given by chunk sizes
             e.g. `{"time": 365, "lat": 50, "lon": 100}`.</br>
-            Has big impact on memory usage. If `None`, no chunking is performed.
+            Has big impact on memory usage. If `None`, no chunking is performed.</br>
+            If `plan`, chunks are chosen with `climdyn_tools.utils.chunking.plan_chunks` from the dimensions,
+            dtypes and internal chunking of the first file, so they are aligned with the files and fit in memory.
         combine: Whether `xarray.combine_by_coords` or `xarray.combine_nested` is used to combine all the data.
         concat_dim: Dimensions to concatenate files along.
             You only need to provide this argument if combine='nested'.
@@ -67,13 +76,35 @@ def load_dataset(exp_name: str, comp: str = 'atm',
             `'2:5'` will load in all months between 2 and 5 inclusive.
         apply_month_shift_fix: If `True`, will apply `ds_month_shift` before returning dataset.</br>
             Only used for monthly averaged data i.e. `hist_file=0`.
+        manifest: If `True`, files are found and combined using an `Exp_manifest` of the experiment saved in
+            the default location, which is refreshed first so only new or changed files are read.
+            Can also be the path to the manifest SQLite file.</br>
+            The dataset is then built without opening every file, if `combine='nested'`, `concat_dim='time'`,
+            `preprocess=None` and all files have the same variables.
+        reference_file: Path to JSON references of the `hist_file` files made with
+            `climdyn_tools.cesm.references.make_references`. If given, the whole run is opened from these as one
+            dataset, rather than opening each file. `year_files` and `month_files` are then applied to the
+            (shifted) time coordinate rather than the file names, and `preprocess` to the combined dataset.
+        variables: Only load these variables e.g. `['TREFHT', 'PRECT']`, as well as the coordinate, bounds and
+            hybrid level coefficient variables they need. All other variables are dropped as each file is opened.
+            Coordinates and variables without a `time` dimension are then taken from the first file,
+            rather than compared across files. If `None`, all variables are loaded.
         logger: Optional logger.
 
     Returns:
         Dataset containing all diagnostics specified for the experiment.
     """
+    if reference_file is not None:
+        return load_references(reference_file, hist_file, chunks, decode_times, preprocess, year_files,
+                               month_files, apply_month_shift_fix, variables, logger)
     exp_dir, comp_id = get_exp_dir(exp_name, comp, archive_dir)
-    if year_files is None and month_files is None:
+    if manifest:
+        exp_manifest = Exp_manifest(exp_dir, exp_name, comp_id, None if manifest is True else manifest)
+        exp_manifest.refresh()
+        file_table = exp_manifest.files(hist_file)
+    else:
+        file_table = None
+    if year_files is None and month_files is None and file_table is None:
         # Load all data in folder
         # * indicates where date index info is, so we combine all datasets
         data_files_load = os.path.join(exp_dir, f'{exp_name}.{comp_id}.h{hist_file}.*.nc')
@@ -81,8 +112,9 @@ def load_dataset(exp_name: str, comp: str = 'atm',
         if hist_file != 0 and month_files is not None:
             warnings.warn(f'If h{hist_file} files not saved monthly then will not have a file for each month so '
                           f'using months_keep={month_files} will miss out different days in different years.')
-        file_dates = get_exp_file_dates(exp_name, comp, archive_dir, hist_file)
-        year_files_all = np.unique(file_dates.dt.year).tolist()
+        if file_table is None:
+            file_table = Hist_catalogue(exp_dir, exp_name, comp_id).select(hist_file)
+        year_files_all = np.unique(file_table['year']).tolist()
         if year_files is None:
             year_files = year_files_all         # all possible years
         else:
@@ -91,7 +123,7 @@ def load_dataset(exp_name: str, comp: str = 'atm',
             if len(years_request_missing) > 0:
                 warnings.warn(f'The requested years = {years_request_missing}\n'
                               f'are missing from the available years = {year_files_all}')
-        month_files_all = np.unique(file_dates.dt.month).tolist()
+        month_files_all = np.unique(file_table['month']).tolist()
         if month_files is None:
             month_files = month_files_all       # all possible months
         else:
@@ -101,37 +133,219 @@ def load_dataset(exp_name: str, comp: str = 'atm',
                 warnings.warn(f'The requested months = {month_request_missing}\n'
                               f'are missing from the available months = {month_files_all}')
 
-        file_ind_keep = [i for i in range(file_dates.size) if (file_dates.dt.year[i] in year_files)
-                         and (file_dates.dt.month[i] in month_files)]
-        if len(file_ind_keep) == 0:
+        # Only load in specific years and/or months
+        file_table = file_table[np.isin(file_table['year'], year_files) & np.isin(file_table['month'], month_files)]
+        data_files_load = file_table['path'].tolist()
+        if len(data_files_load) == 0:
             raise ValueError(f'No files with requested years and months in file name\n'
-                             f'Available years: {np.unique(file_dates.dt.year).tolist()}\n'
-                             f'Available months: {np.unique(file_dates.dt.month).tolist()}\n'
+                             f'Available years: {year_files_all}\n'
+                             f'Available months: {month_files_all}\n'
                              f'Requested years: {year_files}\n'
                              f'Requested months: {month_files}\n')
-
-        # Only load in specific years and/or months
-        data_files_all = os.listdir(exp_dir)
-        # only keep files of correct format
-        data_files_all = [file for file in data_files_all if
-                          fnmatch.fnmatch(file, f'{exp_name}.{comp_id}.h{hist_file}.*.nc')]
-        # only keep files with requested years and months in file name
-        data_files_load = [os.path.join(exp_dir, file) for i, file in enumerate(data_files_all) if
-                           i in file_ind_keep]
     if logger:
         if isinstance(data_files_load, str):
             logger.info(f'Loading data from all files: {data_files_load}')
         else:
             files_str = "\n".join(data_files_load)
             logger.info(f'Loading data from {len(data_files_load)} files:\n{files_str}')
-    if apply_month_shift_fix and hist_file == 0:
+    apply_month_shift_fix = apply_month_shift_fix and hist_file == 0
+    combine_kwargs = {}
+    chunks_plan = None
+    if variables is not None or chunks == 'plan':
+        files = data_files_load if isinstance(data_files_load, list) else sorted(glob.glob(data_files_load))
+        if len(files) == 0:
+            raise FileNotFoundError(f'No files found matching {data_files_load}')
+        with xr.open_dataset(files[0], decode_cf=False) as ds_first:
+            if variables is not None:
+                drop_variables = get_drop_variables(ds_first, variables)
+                combine_kwargs = {'drop_variables': drop_variables, 'coords': 'minimal', 'compat': 'override',
+                                  'data_vars': 'minimal'}
+                ds_first = ds_first.drop_vars(drop_variables)
+            if chunks == 'plan':
+                file_length = ds_first.sizes.get(concat_dim, 1)
+                chunks_plan = plan_chunks(ds_first, file_length, len(files), concat_dim=concat_dim)
+                chunks = file_chunks(chunks_plan, file_length, concat_dim)
+    if manifest and combine == 'nested' and concat_dim == 'time' and preprocess is None:
+        ds = exp_manifest.open_dataset(file_table, decode_times=decode_times and not apply_month_shift_fix,
+                                       drop_variables=combine_kwargs.get('drop_variables'),
+                                       data_vars=combine_kwargs.get('data_vars', 'all'))
+        if ds is not None:
+            if chunks_plan is not None:
+                ds = ds.chunk(dims_chunks(chunks_plan, ds.dims))
+            elif chunks is not None:
+                ds = ds.chunk(chunks)
+            return ds_month_shift(ds, decode_times) if apply_month_shift_fix else ds
+    if apply_month_shift_fix:
+        # Shift applied to each file as it is opened, so combined dataset does not need decoding again
         ds = xr.open_mfdataset(data_files_load, decode_times=False, concat_dim=concat_dim,
-                               combine=combine, chunks=chunks, parallel=parallel, preprocess=preprocess)
-        return ds_month_shift(ds, decode_times)
+                               combine=combine, chunks=chunks, parallel=parallel,
+                               preprocess=partial(_month_shift_preprocess, preprocess=preprocess,
+                                                  decode_times=decode_times), **combine_kwargs)
     else:
-        return xr.open_mfdataset(data_files_load, decode_times=decode_times,
-                                 concat_dim=concat_dim, combine=combine, chunks=chunks, parallel=parallel,
-                                 preprocess=preprocess)
+        ds = xr.open_mfdataset(data_files_load, decode_times=decode_times,
+                               concat_dim=concat_dim, combine=combine, chunks=chunks, parallel=parallel,
+                               preprocess=preprocess, **combine_kwargs)
+    if chunks_plan is not None and chunks_plan.get(concat_dim, 0) > chunks.get(concat_dim, 0):
+        # Combine the chunks of consecutive files
+        ds = ds.chunk({concat_dim: chunks_plan[concat_dim]})
+    return ds
+
+
+def load_ensemble(exp_names: List[str], max_workers: int = 8, logger: Optional[logging.Logger] = None,
+                  **kwargs) -> Tuple[xr.Dataset, pd.DataFrame]:
+    """
+    Loads several experiments concurrently with `load_dataset`, and combines them along a new `experiment`
+    dimension.
+
+    Coordinates shared by all experiments e.g. `lat` and `lon` are taken from the first experiment, and must have
+    the same size in every experiment.
+    Experiments with different times are aligned on the union of all times, with missing times filled with `nan`.
+    An experiment which fails to load is recorded in the report rather than stopping the others from loading.
+
+    Args:
+        exp_names: Name of each experiment to load.
+        max_workers: Maximum number of experiments to load at once.
+        logger: Optional logger.
+        **kwargs: Other arguments passed to `load_dataset` for every experiment e.g. `archive_dir`, `variables`.
+
+    Returns:
+        ds: Dataset of all experiments which loaded, with an `experiment` dimension.
+        report: Table with a row for each experiment, with columns `loaded`, `load_time` (seconds),
+            `n_time` (number of times) and `error` (message if failed to load).
+    """
+    def load_one(exp_name: str) -> Tuple[Optional[xr.Dataset], float, Optional[str]]:
+        start = time.perf_counter()
+        try:
+            ds = load_dataset(exp_name, **kwargs)
+            error = None
+        except Exception as e:
+            ds = None
+            error = f'{type(e).__name__}: {e}'
+        load_time = time.perf_counter() - start
+        if logger:
+            logger.info(f'{exp_name}: ' + (f'loaded in {load_time:.1f}s' if error is None else f'failed - {error}'))
+        return ds, load_time, error
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(load_one, exp_names))
+    report = pd.DataFrame({'loaded': [ds is not None for ds, _, _ in results],
+                           'load_time': [load_time for _, load_time, _ in results],
+                           'n_time': [np.nan if ds is None else ds.sizes.get('time', 0) for ds, _, _ in results],
+                           'error': [error for _, _, error in results]},
+                          index=pd.Index(exp_names, name='experiment'))
+    loaded = [(exp_name, ds) for exp_name, (ds, _, _) in zip(exp_names, results) if ds is not None]
+    if len(loaded) == 0:
+        raise ValueError(f'No experiments could be loaded\n{report["error"].to_string()}')
+    datasets = [ds for _, ds in loaded]
+    if all('time' in ds.indexes for ds in datasets):
+        # Only time is aligned on the union of all experiments, other indexes e.g. lat are those of the first
+        times = xr.align(*[ds.time for ds in datasets], join='outer')[0].time
+        datasets = [ds.reindex(time=times) for ds in datasets]
+    ds = xr.concat(datasets, dim=pd.Index([exp_name for exp_name, _ in loaded], name='experiment'),
+                   data_vars='all', coords='minimal', compat='override', join='override')
+    return ds, report
+
+
+def get_drop_variables(ds: xr.Dataset, variables: List[str]) -> List[str]:
+    """
+    Finds all variables in a history file which are not needed to load `variables`.
+
+    Kept are `variables`, all dimension coordinates, the variables given by the `bounds` and `coordinates`
+    attributes of these, and the hybrid level coefficients if any of `variables` are on model levels.
+
+    Args:
+        ds: Dataset of a history file, only the metadata is used.
+            All files to be loaded are assumed to contain the same variables.
+        variables: Variables to load.
+
+    Returns:
+        Names of variables in `ds` to drop.
+    """
+    missing = [var for var in variables if var not in ds.variables]
+    if len(missing) > 0:
+        raise ValueError(f'Variables {missing} not in dataset, available variables are {list(ds.variables)}')
+    keep = set(variables) | (set(ds.dims) & set(ds.variables))
+    if any(dim in ['lev', 'ilev'] for var in variables for dim in ds[var].dims):
+        keep |= set(hybrid_coef_vars) & set(ds.variables)
+    for var in list(keep):
+        attrs = {**ds[var].encoding, **ds[var].attrs}       # attributes are moved to encoding once decoded
+        keep |= set(attrs.get('coordinates', '').split()) & set(ds.variables)
+        if attrs.get('bounds') in ds.variables:
+            keep.add(attrs['bounds'])
+    return [var for var in ds.variables if var not in keep]
+
+
+def load_references(reference_file: str, hist_file: int = 0,
+                    chunks: Optional[Union[dict, Literal["auto", "plan"], int]] = None,
+                    decode_times: bool = True,
+                    preprocess: Optional[Callable] = None,
+                    year_files: Optional[Union[int, List, str]] = None,
+                    month_files: Optional[Union[int, List, str]] = None,
+                    apply_month_shift_fix: bool = True,
+                    variables: Optional[List[str]] = None,
+                    logger: Optional[logging.Logger] = None) -> xr.Dataset:
+    """
+    Loads a dataset from references made with `climdyn_tools.cesm.references.make_references`,
+    as done by `load_dataset` if `reference_file` is given.
+
+    Args:
+        reference_file: Path to JSON references.
+        hist_file: Which history file the references are for, `0` is the default monthly averaged data set.
+        chunks: Dictionary with keys given by dimension names and values given by chunk sizes.
+            If `None`, there is one chunk per chunk in the files. If `plan`, chunks are chosen with
+            `climdyn_tools.utils.chunking.plan_chunks`.
+        decode_times: If `True`, will convert time to actual date.
+        preprocess: Function applied to the combined dataset.
+        year_files: Only times in these years will be kept. Leave as `None` to keep all years.
+            Same format as for `load_dataset`, requires `decode_times=True`.
+        month_files: Only times in these months will be kept. Leave as `None` to keep all months.
+            Same format as for `load_dataset`, requires `decode_times=True`.
+        apply_month_shift_fix: If `True`, will apply `ds_month_shift` before returning dataset.</br>
+            Only used for monthly averaged data i.e. `hist_file=0`.
+        variables: Only load these variables and the coordinates they need, as for `load_dataset`.
+            If `None`, all variables are loaded.
+        logger: Optional logger.
+
+    Returns:
+        Dataset containing all diagnostics in the references.
+    """
+    from .references import open_references      # not imported at top, so references can be run as a script
+    if logger:
+        logger.info(f'Loading data from references: {reference_file}')
+    apply_month_shift_fix = apply_month_shift_fix and hist_file == 0
+    ds = open_references(reference_file, chunks={} if chunks is None or chunks == 'plan' else chunks,
+                         decode_times=decode_times and not apply_month_shift_fix)
+    # Each chunk in the references along time is at most one file, so the chunks of a variable stored with time
+    # give the file length. Found before any variables are broadcast along time.
+    time_chunks = next((var.chunks[var.dims.index('time')] for var in ds.data_vars.values()
+                        if 'time' in var.dims and var.chunks is not None), None)
+    if variables is not None:
+        ds = ds.drop_vars(get_drop_variables(ds, variables))
+    else:
+        # As with open_mfdataset, data variables without a time dimension are broadcast along time
+        for name in ds.data_vars:
+            if 'time' not in ds[name].dims:
+                ds[name] = ds[name].expand_dims(time=ds.sizes['time'])
+    if chunks == 'plan':
+        ds = ds.chunk(plan_chunks(ds, None if time_chunks is None else max(time_chunks),
+                                  1 if time_chunks is None else len(time_chunks)))
+    if apply_month_shift_fix:
+        ds = ds_month_shift(ds, decode_times)
+    if preprocess is not None:
+        ds = preprocess(ds)
+    if year_files is not None or month_files is not None:
+        if not decode_times:
+            raise ValueError('year_files and month_files can only be used with references if decode_times=True')
+        years = ds.time.dt.year.values
+        months = ds.time.dt.month.values
+        keep = np.ones(ds.time.size, dtype=bool)
+        if year_files is not None:
+            keep &= np.isin(years, parse_int_list(year_files, format_func=lambda x: int(x),
+                                                  all_values=np.unique(years).tolist()))
+        if month_files is not None:
+            keep &= np.isin(months, parse_int_list(month_files, format_func=lambda x: int(x)))
+        ds = ds.isel(time=keep)
+    return ds
 
 
 def get_exp_dir(exp_name: str, comp: str = 'atm', archive_dir: str = jasmin_archive_dir):
@@ -213,21 +427,7 @@ def get_exp_file_dates(exp_name: str, comp: str = 'atm', archive_dir: str = jasm
         DataArray of dates indicated in file names of `exp_name`.
     """
     exp_dir, comp_id = get_exp_dir(exp_name, comp, archive_dir)
-    # Only load in specific years and/or months
-    data_files_all = os.listdir(exp_dir)
-    # only keep files of correct format
-    file_dates = []
-    for file in data_files_all:
-        date = re.search(rf'h{hist_file}\.(.*?)\.nc', file)
-        if not date:
-            continue
-        file_dates.append(parse_cesm_datetime(date.group(1)))
-    try:
-        return xr.DataArray(np.array(file_dates, dtype='datetime64[D]'), dims="time", name="time")
-    except OutOfBoundsDatetime as e:
-        warnings.warn(f"Got out of bounds error, re-trying with NoLeap Calendar and cftime\n{e}")
-        cftime_dates = [cftime.DatetimeNoLeap(dt.year, dt.month, dt.day) for dt in file_dates]
-        return xr.DataArray(CFTimeIndex(cftime_dates, calendar="noleap"), dims="time", name="time")
+    return Hist_catalogue(exp_dir, exp_name, comp_id).dates(hist_file)
 
 
 def ds_month_shift(ds: xr.Dataset, decode_times: bool = True) -> xr.Dataset:
@@ -235,48 +435,168 @@ def ds_month_shift(ds: xr.Dataset, decode_times: bool = True) -> xr.Dataset:
     When loading CESM data, for some reason the first month is marked as February, so this function
     shifts the time variable to correct it to January.
 
+    Each time is marked at the end of the month averaged over i.e. the start of the next month,
+    so is shifted back by the length of the previous month, given the calendar of the time variable.
+    This does not depend on the other times in `ds`, so can be applied to a run starting in any month,
+    or to each file separately in the `preprocess` of `xarray.open_mfdataset`.
+
     Args:
         ds: Dataset to apply the shift to.
             It should have been loaded with `decode_times=False`.
-        decode_times: If `True`, will convert time to actual date.
+        decode_times: If `True`, will convert time (and its bounds) to actual date.
 
     Returns:
         Dataset with first months shifted by -1 so now first month is January.
     """
-    n_day_month = np.asarray(
-        [cftime.DatetimeNoLeap(1, i + 1, 1).daysinmonth for i in range(12)])  # number of days in each month
-    months_in_ds = np.arange(1, 13)                             # TODO may have to get months from ds e.g. ds.time.dt.month
-    n_day_month = n_day_month[np.asarray(months_in_ds) - 1]
-    n_months_in_ds = ds.time.size
-    n_years_in_ds = int(np.floor(n_months_in_ds / 12))
-    month_shift_array = np.concatenate((np.tile(n_day_month, n_years_in_ds),
-                                        n_day_month[:n_months_in_ds % 12]))
-    ds_new = ds.assign_coords({'time': ('time', ds.time.values - month_shift_array, ds.time.attrs)})
+    units = ds.time.attrs['units']
+    calendar = ds.time.attrs.get('calendar', 'standard')
+    time = ds.time.values
+    dates = xr.coding.times.decode_cf_datetime(time, units, calendar)
+    if np.issubdtype(dates.dtype, np.datetime64):
+        year_month = dates.astype('datetime64[M]').astype(np.int64)
+        year, month = year_month // 12 + 1970, year_month % 12 + 1
+    else:
+        dates = xr.CFTimeIndex(dates)
+        year, month = np.asarray(dates.year), np.asarray(dates.month)
+    # Month averaged over is the one before the month of the time
+    prev_year = np.where(month == 1, year - 1, year)
+    prev_month = (month - 2) % 12 + 1
+    units_per_day = {'days': 1, 'hours': 24, 'minutes': 24 * 60, 'seconds': 24 * 60 * 60}[units.split()[0]]
+    shift = days_in_month(prev_year, prev_month, calendar) * units_per_day
+    ds_new = ds.assign_coords({'time': ('time', time - shift, ds.time.attrs)})
     if decode_times:
-        ds_new = xr.decode_cf(ds_new)
+        # Only decode time and its bounds, all other variables have already been decoded
+        time_vars = [name for name in ['time', ds.time.attrs.get('bounds')] if name in ds_new.variables]
+        decoded = xr.decode_cf(ds_new[time_vars])
+        ds_new = ds_new.assign_coords(time=decoded.time)
+        for name in time_vars[1:]:
+            ds_new[name] = decoded[name]
     return ds_new
 
+
+def days_in_month(year: Union[np.ndarray, int], month: Union[np.ndarray, int],
+                  calendar: str = 'noleap') -> np.ndarray:
+    """
+    Number of days in each month, for the CF calendars.
+
+    Args:
+        year: `int [n]`</br>
+            Year of each month.
+        month: `int [n]`</br>
+            Month (1 is Jan).
+        calendar: CF calendar e.g. `noleap`, `standard`, `proleptic_gregorian`, `julian`, `all_leap` or `360_day`.
+
+    Returns:
+        `int [n]`</br>
+            Number of days in each month.
+    """
+    year = np.asarray(year)
+    month = np.asarray(month)
+    calendar = calendar.lower()
+    if calendar == '360_day':
+        return np.full(np.broadcast(year, month).shape, 30)
+    n_days = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[month - 1]
+    if calendar in ['noleap', '365_day']:
+        return n_days
+    if calendar in ['all_leap', '366_day']:
+        leap = np.ones_like(year, dtype=bool)
+    elif calendar == 'julian':
+        leap = year % 4 == 0
+    elif calendar == 'proleptic_gregorian':
+        leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    elif calendar in ['standard', 'gregorian']:
+        # Julian before 1582, Gregorian after
+        leap = (year % 4 == 0) & ((year < 1583) | (year % 100 != 0) | (year % 400 == 0))
+    else:
+        raise ValueError(f'calendar={calendar} not recognised')
+    return n_days + ((month == 2) & leap)
+
+
+def _month_shift_preprocess(ds: xr.Dataset, preprocess: Optional[Callable] = None,
+                            decode_times: bool = True) -> xr.Dataset:
+    # Preprocess of each file, applying user preprocess then ds_month_shift, so combined dataset is already shifted
+    if preprocess is not None:
+        ds = preprocess(ds)
+    return ds_month_shift(ds, decode_times)
+
+
 def select_months(ds: xr.Dataset, month_nh: Union[np.ndarray, List[int]],
-                  month_sh: Optional[Union[np.ndarray, List[int]]] = None) -> xr.Dataset:
+                  month_sh: Optional[Union[np.ndarray, List[int]]] = None,
+                  reduce: Optional[Union[str, Callable]] = None) -> xr.Dataset:
     """
     In dataset, keep only `month_nh` months in the northern hemisphere, and `month_sh` in the southern hemisphere.
 
+    Times are selected by index rather than masked, so the result only contains the selected months, is lazy if
+    `ds` is, and keeps the dtype of each variable.
+
+    If `month_sh` is given, the two hemispheres (`lat >= 0` and `lat < 0`) are selected separately and combined
+    along `lat`. Without `reduce`, `month_nh` and `month_sh` must be the same length, and each is taken to be a
+    season in calendar order, so months before the year changes e.g. December in `[12, 1, 2]` belong to the season
+    of the following year. Times are then paired by season year and position in the season: with
+    `month_nh=[6, 7, 8]` and `month_sh=[12, 1, 2]`, June, July and August of year `y` are placed alongside
+    December of `y-1`, January and February of `y`. Times without a partner in the other hemisphere, e.g. at the
+    start or end of `ds`, are dropped. With more than one time per month, the n-th time of each month is paired.
+    The `time` coordinate is then that of the northern hemisphere, with the southern hemisphere times given by the
+    `time_sh` coordinate, and variables without `lat` are those of the northern hemisphere times.
+
     Args:
         ds: Dataset to select months from.
         month_nh: List of months to keep in northern hemisphere.
         month_sh: List of months to keep in southern hemisphere. If `None`, will be the same as `month_nh`.
+        reduce: Optional reduction over the selected times, applied to each hemisphere before they are combined.
+            Either the name of a `Dataset` method taking a `dim` argument e.g. `mean`, or a function taking
+            and returning a dataset. The hemispheres then do not need the same number of selected times.
 
     Returns:
-        Dataset with months selected.
+        Dataset with months selected, or the reduction over them if `reduce` is given.
     """
-    # Select months for NH
+    def apply_reduce(ds_months: xr.Dataset) -> xr.Dataset:
+        if reduce is None:
+            return ds_months
+        return getattr(ds_months, reduce)(dim='time') if isinstance(reduce, str) else reduce(ds_months)
+
+    month = ds.time.dt.month.values
+    ds_nh = ds.isel(time=np.flatnonzero(np.isin(month, month_nh)))
     if month_sh is None:
-        mask = ds.time.dt.month.isin(month_nh)
-    else:
-        mask_nh = (ds.lat >= 0) & (ds.time.dt.month.isin(month_nh))
-        mask_sh = (ds.lat < 0) & (ds.time.dt.month.isin(month_sh))
-        mask = mask_nh | mask_sh
-    return ds.where(mask)
+        return apply_reduce(ds_nh)
+    ds_sh = ds.isel(time=np.flatnonzero(np.isin(month, month_sh)))
+    lat = ds.lat.values
+    ds_nh = ds_nh.isel(lat=np.flatnonzero(lat >= 0))
+    ds_sh = ds_sh.isel(lat=np.flatnonzero(lat < 0))
+    if reduce is None:
+        if len(month_nh) != len(month_sh):
+            raise ValueError(f'month_nh={list(month_nh)} and month_sh={list(month_sh)} must have the same number of '
+                             f'months to pair times of the two hemispheres, unless reduce is given')
+        pairs = _season_keys(ds_nh.time, month_nh).merge(_season_keys(ds_sh.time, month_sh),
+                                                         on=['season_year', 'position', 'n'], suffixes=('_nh', '_sh'))
+        pairs = pairs.sort_values('index_nh')
+        ds_nh = ds_nh.isel(time=pairs['index_nh'].to_numpy())
+        ds_sh = ds_sh.isel(time=pairs['index_sh'].to_numpy())
+        time_sh = ('time', ds_sh.time.values)
+        ds_nh = ds_nh.assign_coords(time_sh=time_sh)
+        ds_sh = ds_sh.assign_coords(time=ds_nh.time, time_sh=time_sh)
+    ds_nh = apply_reduce(ds_nh)
+    ds_sh = apply_reduce(ds_sh)
+    # Keep the original order of latitudes
+    ds_hemispheres = [ds_sh, ds_nh] if lat[0] < lat[-1] else [ds_nh, ds_sh]
+    ds_out = xr.concat(ds_hemispheres, dim='lat', data_vars='minimal', coords='minimal', compat='override',
+                       join='override')
+    for name in ds_nh.data_vars:
+        if 'lat' not in ds_nh[name].dims:
+            ds_out[name] = ds_nh[name]      # same in both hemispheres, so not concatenated
+    return ds_out
+
+
+def _season_keys(time: xr.DataArray, months: Union[np.ndarray, List[int]]) -> pd.DataFrame:
+    # Season year, position of the month in months and index within the month of each time, with months before
+    # the year changes in months e.g. December in [12, 1, 2] counted in the season of the following year
+    months = [int(m) for m in months]
+    wrap = next((i + 1 for i in range(len(months) - 1) if months[i + 1] < months[i]), 0)
+    position = np.array([months.index(m) for m in time.dt.month.values], dtype=int)
+    keys = pd.DataFrame({'index': np.arange(time.size), 'season_year': time.dt.year.values + (position < wrap),
+                         'position': position})
+    keys['n'] = keys.groupby(['season_year', 'position']).cumcount()
+    return keys
 
 
 def load_z2m(surf_geopotential_file: str = jasmin_surf_geopotential_file,
@@ -284,6 +604,10 @@ def load_z2m(surf_geopotential_file: str = jasmin_surf_geopotential_file,
     """
     Returns 2m geopotential height for CESM simulation.
 
+    The surface geopotential is only read from `surf_geopotential_file` the first time it is requested
+    (or if the file has since changed), and the nearest neighbour mapping onto the grid of `var_reindex_like`
+    is only computed the first time for each grid, so calling this once per experiment is cheap.
+
     Args:
         surf_geopotential_file: File location of input data containing the geopotential at the surface: `PHIS`.
         var_reindex_like: Can provide a variable so `z2m` will have the same lat-lon as this variable.
@@ -292,11 +616,78 @@ def load_z2m(surf_geopotential_file: str = jasmin_surf_geopotential_file,
         2m geopotential height in units of meters.
     """
     # PHIS is the geopotential at the surface, so to get Z at reference height, divide by g and add 2
-    ds_z2m = xr.open_dataset(surf_geopotential_file)[['PHIS']]
     z_refht = 2   # reference height is at 2m
-    ds_z2m['ZREFHT'] = ds_z2m['PHIS'] / g + z_refht               # PHIS is geopotential in m2/s2 so need to convert
-    del ds_z2m['PHIS']
+    z2m = load_surface_field(surf_geopotential_file, 'PHIS') / g + z_refht  # PHIS is geopotential in m2/s2
     if var_reindex_like is not None:
-        ds_z2m = ds_z2m.reindex_like(var_reindex_like, method="nearest", tolerance=0.01)
-    ds_z2m = set_attrs(ds_z2m.ZREFHT, long_name='Geopotential height at reference height (2m)', units='m')
-    return ds_z2m
+        z2m = reindex_nearest(z2m, var_reindex_like, tolerance=0.01)
+    z2m = set_attrs(z2m.rename('ZREFHT'), long_name='Geopotential height at reference height (2m)', units='m')
+    return z2m
+
+
+def load_surface_field(surf_file: str, var: str = 'PHIS') -> xr.DataArray:
+    """
+    Returns a time invariant surface field e.g. `PHIS` from `surf_file`.
+
+    Each field is read once per process and kept in memory, and only read again if the modification time of
+    `surf_file` changes. A copy is returned, so it can be modified without changing the stored field.
+
+    Args:
+        surf_file: File containing the field.
+        var: Name of the field in `surf_file`.
+
+    Returns:
+        Field loaded into memory.
+    """
+    surf_file = os.path.abspath(os.path.expandvars(surf_file))
+    return _load_surface_field(surf_file, var, os.path.getmtime(surf_file)).copy()
+
+
+@lru_cache(maxsize=32)
+def _load_surface_field(surf_file: str, var: str, mtime: float) -> xr.DataArray:
+    # mtime is only used so the cached field is replaced if the file changes
+    with xr.open_dataset(surf_file) as ds:
+        return ds[var].load()
+
+
+def reindex_nearest(var: xr.DataArray, var_reindex_like: Union[xr.DataArray, xr.Dataset],
+                    tolerance: Optional[float] = None) -> xr.DataArray:
+    """
+    Same as `var.reindex_like(var_reindex_like, method="nearest", tolerance=tolerance)`, but the integer index
+    of the nearest value is only found once for each pair of grids. Reindexing further variables from the same grid
+    onto the same target grid is then an integer `isel`.
+
+    Args:
+        var: Variable to reindex.
+        var_reindex_like: Object whose indexes are used, e.g. `lat` and `lon` of a variable on the target grid.
+        tolerance: Maximum distance between original and new coordinate values. Values further than this from
+            any original coordinate are set to NaN.
+
+    Returns:
+        `var` on the grid of `var_reindex_like`.
+    """
+    indexers = {}
+    valid = []
+    for dim in var.dims:
+        if dim not in var_reindex_like.indexes or dim not in var.indexes:
+            continue
+        source = var.indexes[dim]
+        target = var_reindex_like.indexes[dim]
+        index = _nearest_index(source.values.tobytes(), source.dtype.str, target.values.tobytes(), target.dtype.str,
+                               tolerance)
+        indexers[dim] = xr.Variable(dim, np.clip(index, 0, None))
+        if (index < 0).any():
+            valid.append(xr.DataArray(index >= 0, dims=dim))
+    var = var.isel(indexers).assign_coords({dim: var_reindex_like.indexes[dim] for dim in indexers})
+    for mask in valid:
+        var = var.where(mask)
+    return var
+
+
+@lru_cache(maxsize=128)
+def _nearest_index(source: bytes, source_dtype: str, target: bytes, target_dtype: str,
+                   tolerance: Optional[float]) -> np.ndarray:
+    # Coordinates passed as bytes so they can be the key of the cache. -1 where no value within tolerance
+    source = pd.Index(np.frombuffer(source, dtype=source_dtype))
+    index = source.get_indexer(np.frombuffer(target, dtype=target_dtype), method='nearest', tolerance=tolerance)
+    index.flags.writeable = False
+    return index
@@ -0,0 +1,198 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import xarray as xr
+import dask
+import dask.array as da
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Literal
+from ..utils.sqlite import sqlite_connect, sqlite_create
+from .catalogue import Hist_catalogue
+
+default_manifest_dir = '~/.cache/climdyn_tools/cesm_manifests'
+
+
+class Exp_manifest:
+    """
+    Persistent record of the header of every history file of one component of a CESM experiment,
+    saved as a SQLite file.
+
+    For each file, the size, modification time, raw time values, variables and their dimensions are recorded.
+    `refresh` only reads the header of files which are new or whose size or modification time has changed,
+    so for a running experiment only the latest files are read. `open_dataset` then builds the combined dataset
+    from the manifest and the header of a single file, reading the data of the other files only when needed.
+
+    Examples:
+        ```
+        manifest = Exp_manifest(hist_dir, 'exp', 'cam')
+        manifest.refresh()
+        ds = manifest.open_dataset(manifest.files(hist_file=0, years=[1, 2]))
+        ```
+    """
+    def __init__(self, hist_dir: str, exp_name: str, comp_id: str, manifest_file: Optional[str] = None):
+        """
+        Args:
+            hist_dir: Directory containing the history files e.g. `{archive_dir}/{exp_name}/atm/hist`.
+            exp_name: Name of experiment, which is the start of each file name.
+            comp_id: String indicating the component in each file name e.g. `cam`.
+            manifest_file: Path to SQLite file in which to save the manifest. Will be created if does not exist.
+                If `None`, will be saved in `~/.cache/climdyn_tools/cesm_manifests/`.
+        """
+        self.hist_dir = os.path.abspath(os.path.expandvars(os.path.expanduser(hist_dir)))
+        self.exp_name = exp_name
+        self.comp_id = comp_id
+        if manifest_file is None:
+            hist_dir_hash = hashlib.sha1(self.hist_dir.encode()).hexdigest()[:10]
+            manifest_file = os.path.join(default_manifest_dir, f"{exp_name}.{comp_id}.{hist_dir_hash}.sqlite")
+        self.manifest_file = sqlite_create(manifest_file, [
+            "CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, hist_file INTEGER, "
+            "year INTEGER, month INTEGER, day INTEGER, seconds INTEGER, size INTEGER, mtime REAL, "
+            "n_time INTEGER, time_start REAL, time_end REAL, time TEXT, variables TEXT)"])
+
+    def refresh(self, max_workers: int = 8) -> int:
+        """
+        Updates the manifest, only reading the header of files which are new or have changed.
+        Files no longer in `hist_dir` are removed from the manifest.
+
+        Args:
+            max_workers: Number of threads used to read headers concurrently.
+
+        Returns:
+            Number of files whose header was read.
+        """
+        table = Hist_catalogue(self.hist_dir, self.exp_name, self.comp_id, stat=True).table
+        table['name'] = [os.path.basename(path) for path in table['path']]
+        with sqlite_connect(self.manifest_file) as conn:
+            known = pd.DataFrame(conn.execute("SELECT name, size, mtime FROM files").fetchall(),
+                                 columns=['name', 'size_known', 'mtime_known'])
+        table = table.merge(known, on='name', how='left')
+        changed = table[(table['size'] != table['size_known']) | (table['mtime'] != table['mtime_known'])]
+        removed = set(known['name']) - set(table['name'])
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            headers = list(executor.map(read_header, changed['path']))
+        with sqlite_connect(self.manifest_file) as conn:
+            conn.executemany("DELETE FROM files WHERE name = ?", [(name,) for name in removed])
+            conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(row.name, row.hist_file, row.year, row.month, row.day, row.seconds, row.size,
+                               row.mtime, len(time), time[0] if len(time) > 0 else None,
+                               time[-1] if len(time) > 0 else None, json.dumps(time), json.dumps(variables))
+                              for row, (time, variables) in zip(changed.itertuples(), headers)])
+        return len(changed)
+
+    def files(self, hist_file: int = 0, years: Optional[List[int]] = None,
+              months: Optional[List[int]] = None) -> pd.DataFrame:
+        """
+        Args:
+            hist_file: Which history file to select.
+            years: Only keep files with these years in their name. If `None`, will keep all years.
+            months: Only keep files with these months (1 is Jan) in their name. If `None`, will keep all months.
+
+        Returns:
+            Manifest of the selected files, sorted by date, with columns `path`, `hist_file`, `year`, `month`,
+                `day`, `seconds`, `size`, `mtime`, `n_time`, `time_start`, `time_end`, `time` (list of raw time values)
+                and `variables` (dictionary of `dims`, `shape` and `dtype` of each variable).
+        """
+        with sqlite_connect(self.manifest_file) as conn:
+            rows = conn.execute("SELECT * FROM files WHERE hist_file = ? ORDER BY year, month, day, seconds, name",
+                                (hist_file,)).fetchall()
+        df = pd.DataFrame(rows, columns=['name', 'hist_file', 'year', 'month', 'day', 'seconds', 'size', 'mtime',
+                                         'n_time', 'time_start', 'time_end', 'time', 'variables'])
+        mask = np.ones(len(df), dtype=bool)
+        if years is not None:
+            mask &= np.isin(df['year'].to_numpy(), years)
+        if months is not None:
+            mask &= np.isin(df['month'].to_numpy(), months)
+        df = df[mask].reset_index(drop=True)
+        df.insert(0, 'path', [os.path.join(self.hist_dir, name) for name in df['name']])
+        df['time'] = [json.loads(t) for t in df['time']]
+        df['variables'] = [json.loads(v) for v in df['variables']]
+        return df.drop(columns='name')
+
+    def open_dataset(self, files: pd.DataFrame, decode_times: bool = True, drop_variables: Optional[List[str]] = None,
+                     data_vars: Literal['all', 'minimal'] = 'all') -> Optional[xr.Dataset]:
+        """
+        Combines files along `time`, using the manifest rather than opening every file.
+
+        Only the header of the first file is read. Variables without a `time` dimension are taken from this file,
+        and each variable with a `time` dimension is a lazy dask array, with one chunk per file.
+        The result is the same as `xarray.open_mfdataset(paths, combine='nested', concat_dim='time')`.
+
+        Args:
+            files: Rows of `files` to combine, in the order they should be combined.
+            decode_times: If `True`, will convert time to actual date.
+            drop_variables: Variables to not include in the dataset.
+            data_vars: If `all`, data variables without a `time` dimension are broadcast along `time`,
+                as with the default of `xarray.open_mfdataset`. If `minimal`, they are not.
+
+        Returns:
+            Combined dataset. `None` if files do not all have the same variables, in which case they should be
+                opened with `xarray.open_mfdataset`.
+        """
+        if len(files) == 0:
+            raise ValueError(f'No files given to open for {self.exp_name}.{self.comp_id}')
+        drop_variables = [] if drop_variables is None else drop_variables
+        variables = {name: info for name, info in files['variables'].iloc[0].items() if name not in drop_variables}
+        signature = _variables_signature(variables)
+        if any(_variables_signature({name: info for name, info in v.items() if name not in drop_variables})
+               != signature for v in files['variables'].iloc[1:]):
+            return None
+        paths = files['path'].tolist()
+        n_time = files['n_time'].tolist()
+        with xr.open_dataset(paths[0], decode_cf=False) as template:
+            ds_vars = {}
+            for name, info in variables.items():
+                attrs = template[name].attrs
+                if name == 'time':
+                    ds_vars[name] = xr.Variable('time', np.concatenate(files['time'].tolist()), attrs)
+                elif 'time' not in info['dims']:
+                    ds_vars[name] = template[name].variable.load()
+                else:
+                    time_axis = info['dims'].index('time')
+                    blocks = []
+                    for path, n in zip(paths, n_time):
+                        shape = list(info['shape'])
+                        shape[time_axis] = n
+                        blocks.append(da.from_delayed(dask.delayed(_read_raw)(path, name), shape=tuple(shape),
+                                                      dtype=np.dtype(info['dtype'])))
+                    ds_vars[name] = xr.Variable(info['dims'], da.concatenate(blocks, axis=time_axis), attrs)
+            ds = xr.Dataset(ds_vars, attrs=template.attrs)
+            ds = ds.set_coords([name for name in template.coords if name in ds and name not in ds.dims])
+        ds = xr.decode_cf(ds, decode_times=decode_times)
+        # As with open_mfdataset, data variables without a time dimension are broadcast along time
+        for name in (ds.data_vars if data_vars == 'all' else []):
+            if 'time' not in ds[name].dims:
+                ds[name] = ds[name].expand_dims(time=ds.sizes['time'])
+        return ds
+
+
+def read_header(path: str) -> tuple:
+    """
+    Reads the information recorded in `Exp_manifest` from a single history file.
+
+    Args:
+        path: Path to history file.
+
+    Returns:
+        time: List of raw (not decoded) time values in the file.
+        variables: Dictionary with a key for each variable, and values of dictionaries giving the
+            `dims`, `shape` and `dtype` of the variable.
+    """
+    with xr.open_dataset(path, decode_cf=False) as ds:
+        time = ds['time'].values.tolist() if 'time' in ds.variables else []
+        variables = {name: {'dims': list(var.dims), 'shape': list(var.shape), 'dtype': var.dtype.str}
+                     for name, var in ds.variables.items()}
+    return time, variables
+
+
+def _variables_signature(variables: dict) -> dict:
+    # Information about variables which must be the same in every file to combine them, i.e. excluding time length
+    return {name: (tuple(info['dims']), tuple(s for d, s in zip(info['dims'], info['shape']) if d != 'time'),
+                   info['dtype']) for name, info in variables.items()}
+
+
+def _read_raw(path: str, name: str) -> np.ndarray:
+    # Reads raw (not decoded) values of a single variable from a single file
+    with xr.open_dataset(path, decode_cf=False) as ds:
+        return ds[name].values
@@ -0,0 +1,153 @@
+"""
+Virtual aggregated references of the history files of a CESM experiment, in the
+[kerchunk](https://fsspec.github.io/kerchunk/) JSON format.
+
+The references record where each chunk of each variable is within the NetCDF files, so a whole run can be opened
+as a single lazily chunked Zarr dataset, in about the time it takes to open a single file. The NetCDF files are
+still read directly, and the reference file only needs to be remade when new files are added.
+
+Examples:
+    Make the references from the command line:
+    ```
+    python -m climdyn_tools.cesm.references exp_name --archive_dir /path/to/archive
+    ```
+    Then load with `load_dataset(exp_name, reference_file=...)` or `open_references(...)`.
+"""
+import os
+import json
+import hashlib
+import argparse
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Literal, Union
+try:
+    import kerchunk.hdf
+    import kerchunk.netCDF3
+    from kerchunk.combine import MultiZarrToZarr
+except ImportError:
+    kerchunk = None             # kerchunk is optional, only needed to make references
+from .catalogue import Hist_catalogue
+
+default_reference_dir = '~/.cache/climdyn_tools/cesm_references'
+
+
+def netcdf_format(path: str) -> Literal['netcdf3', 'hdf5']:
+    """
+    Finds whether a NetCDF file is in the classic NetCDF3 format or the HDF5 based NetCDF4 format,
+    from the first bytes of the file.
+
+    Args:
+        path: Path to NetCDF file.
+
+    Returns:
+        `netcdf3` or `hdf5`.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(8)
+    if magic[:3] == b'CDF':
+        return 'netcdf3'
+    if magic == b'\x89HDF\r\n\x1a\n':
+        return 'hdf5'
+    raise ValueError(f'{path} is not a NetCDF3 or HDF5 file')
+
+
+def file_references(path: str, inline_threshold: int = 300) -> dict:
+    """
+    Args:
+        path: Path to NetCDF file.
+        inline_threshold: Chunks smaller than this many bytes are saved within the references,
+            rather than as a reference to the file.
+
+    Returns:
+        Kerchunk references of a single file.
+    """
+    if netcdf_format(path) == 'netcdf3':
+        return kerchunk.netCDF3.NetCDF3ToZarr(path, inline_threshold=inline_threshold).translate()
+    return kerchunk.hdf.SingleHdf5ToZarr(path, inline_threshold=inline_threshold).translate()
+
+
+def default_reference_file(hist_dir: str, exp_name: str, comp_id: str, hist_file: int) -> str:
+    """
+    Args:
+        hist_dir: Directory containing the history files.
+        exp_name: Name of experiment.
+        comp_id: String indicating the component in each file name e.g. `cam`.
+        hist_file: Which history file.
+
+    Returns:
+        Path in `~/.cache/climdyn_tools/cesm_references/` where references are saved if no path is given.
+    """
+    hist_dir_hash = hashlib.sha1(os.path.abspath(hist_dir).encode()).hexdigest()[:10]
+    return os.path.expanduser(os.path.join(default_reference_dir,
+                                           f"{exp_name}.{comp_id}.h{hist_file}.{hist_dir_hash}.json"))
+
+
+def make_references(hist_dir: str, exp_name: str, comp_id: str, hist_file: int = 0,
+                    reference_file: Optional[str] = None, max_workers: int = 8) -> str:
+    """
+    Makes references for all `hist_file` files of an experiment, combined along `time`, and saves them as JSON.
+
+    Args:
+        hist_dir: Directory containing the history files e.g. `{archive_dir}/{exp_name}/atm/hist`.
+        exp_name: Name of experiment, which is the start of each file name.
+        comp_id: String indicating the component in each file name e.g. `cam`.
+        hist_file: Which history file to make references for.
+        reference_file: Path of JSON file to save references to.
+            If `None`, will be saved in `~/.cache/climdyn_tools/cesm_references/`.
+        max_workers: Number of threads used to read files concurrently.
+
+    Returns:
+        Path of the saved reference file.
+    """
+    if kerchunk is None:
+        raise ImportError("make_references requires kerchunk, install with pip install kerchunk h5py")
+    paths = Hist_catalogue(hist_dir, exp_name, comp_id).select(hist_file)['path'].tolist()
+    if len(paths) == 0:
+        raise ValueError(f'No h{hist_file} files found for {exp_name}.{comp_id} in {hist_dir}')
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        refs = list(executor.map(file_references, paths))
+    # Variables without a time dimension are the same in every file, so only taken from the first
+    with xr.open_dataset(paths[0], decode_cf=False) as ds:
+        identical_dims = [name for name, var in ds.variables.items() if 'time' not in var.dims]
+    combined = MultiZarrToZarr(refs, concat_dims=['time'], identical_dims=identical_dims,
+                               remote_protocol='file').translate()
+    if reference_file is None:
+        reference_file = default_reference_file(hist_dir, exp_name, comp_id, hist_file)
+    reference_file = os.path.expandvars(os.path.expanduser(reference_file))
+    os.makedirs(os.path.dirname(os.path.abspath(reference_file)), exist_ok=True)
+    with open(reference_file, 'w') as f:
+        json.dump(combined, f)
+    return reference_file
+
+
+def open_references(reference_file: str, chunks: Optional[Union[dict, Literal["auto"], int]] = {},
+                    decode_times: bool = True) -> xr.Dataset:
+    """
+    Opens references made with `make_references` as a single dataset.
+
+    Args:
+        reference_file: Path of JSON reference file.
+        chunks: Chunks of the returned dask arrays. The default `{}` uses one chunk per chunk in the files.
+        decode_times: If `True`, will convert time to actual date.
+
+    Returns:
+        Lazy dataset of all files in the references.
+    """
+    return xr.open_dataset("reference://", engine="zarr", chunks=chunks, decode_times=decode_times,
+                           backend_kwargs={"consolidated": False,
+                                           "storage_options": {"fo": reference_file, "remote_protocol": "file"}})
+
+
+if __name__ == '__main__':
+    from .load import get_exp_dir, jasmin_archive_dir
+    parser = argparse.ArgumentParser(description="Make kerchunk references for the history files of a CESM "
+                                                 "experiment, so it can be opened as a single dataset.")
+    parser.add_argument('exp_name', help="Name of folder in archive_dir where data for the experiment was saved.")
+    parser.add_argument('--comp', default='atm', help="Component of CESM e.g. atm.")
+    parser.add_argument('--archive_dir', default=jasmin_archive_dir, help="Directory where CESM archive data saved.")
+    parser.add_argument('--hist_file', type=int, default=0, help="Which history file e.g. 0 for h0.")
+    parser.add_argument('--out', default=None, help="Path of JSON file to save references to.")
+    parser.add_argument('--max_workers', type=int, default=8, help="Number of threads used to read files.")
+    args = parser.parse_args()
+    exp_dir, comp_id = get_exp_dir(args.exp_name, args.comp, os.path.expandvars(args.archive_dir))
+    print(make_references(exp_dir, args.exp_name, comp_id, args.hist_file, args.out, args.max_workers))
@@ -1 +1,3 @@
 from .core import Find_era5
+from .file_index import Era5_index
+from .cache import Era5_cache
\ No newline at end of file
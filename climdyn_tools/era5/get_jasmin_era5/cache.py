@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+import xarray as xr
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, TYPE_CHECKING
+from ...utils.sqlite import sqlite_connect, sqlite_create
+try:
+    import zarr
+except ImportError:
+    zarr = None                 # zarr is optional, only needed if using the cache
+
+from .utils import split_time_slice
+
+if TYPE_CHECKING:
+    from .core import Find_era5
+
+
+class Era5_cache:
+    """
+    Local Zarr store of blocks of ERA5 data already extracted from the JASMIN archive.
+
+    A request is split into blocks of time, and each block is saved the first time it is loaded.
+    Later requests for the same archive, variables, model, block and selection are then read from the store,
+    avoiding the NetCDF decoding and the latency of the archive.
+    A block is re-extracted if the modification time or number of its source files has changed.
+    When the store exceeds `max_size_gb`, the least recently used blocks are deleted.
+
+    Examples:
+        ```
+        era5 = Find_era5(cache='/work/scratch-nopw2/$USER/era5_cache')
+        ds = era5['2t', '2020-01-01':'2020-02-01', None, 90:270, -60:60]    # slow the first time
+        ds = era5['2t', '2020-01-01':'2020-02-01', None, 90:270, -60:60]    # read from cache
+        ```
+    """
+    def __init__(self, cache_dir: str, max_size_gb: float = 50, block: str = '1D',
+                 max_chunk_mb: float = 64):
+        """
+        Args:
+            cache_dir: Directory in which to save the store. Will be created if does not exist.
+            max_size_gb: Maximum size of the store in GB.
+            block: Pandas frequency string giving the length of time saved as each block e.g. `1D` or `1MS`.
+                Each block is stored as a single chunk in time.
+            max_chunk_mb: Maximum size of a chunk in MB. If a block of a variable is larger than this,
+                it is also split along its largest other dimension.
+        """
+        if zarr is None:
+            raise ImportError("Era5_cache requires zarr, install with pip install zarr")
+        self.cache_dir = os.path.expandvars(os.path.expanduser(cache_dir))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_size = int(max_size_gb * 1e9)
+        self.block = block
+        self.max_chunk_size = int(max_chunk_mb * 1e6)
+        self.db_file = sqlite_create(os.path.join(self.cache_dir, 'cache.sqlite'), [
+            "CREATE TABLE IF NOT EXISTS blocks (key TEXT PRIMARY KEY, size INTEGER, "
+            "last_access REAL, source_mtime REAL, n_files INTEGER)"])
+
+    def get(self, era5: 'Find_era5', args) -> xr.Dataset:
+        """
+        Loads data as `era5[args]` would, using the cache for each block of time.
+
+        Args:
+            era5: Object used to find and load data not in the cache.
+            args: Arguments as for `Find_era5[...]`, the date must be a slice.
+
+        Returns:
+            Dataset combining all blocks of time, lazily read from the store.
+        """
+        var = [args[0]] if isinstance(args[0], str) else list(args[0])
+        model = args[5] if len(args) > 5 else "oper"
+        sel = tuple(args[i] if len(args) > i else None for i in range(2, 5))
+        blocks = split_time_slice(args[1], self.block)
+        keys = [self.block_key(era5, var, block, sel, model) for block in blocks]
+        ds_blocks = []
+        for block, key in zip(blocks, keys):
+            files = era5.find_source_files(var, block, model)
+            if len(files) == 0:
+                continue
+            ds_blocks.append(self._get_block(era5, (var, block) + sel + (model,), key, files))
+        if len(ds_blocks) == 0:
+            return era5._load(args)     # nothing found, so raise the usual error
+        self._evict(protect=keys)
+        if len(ds_blocks) == 1:
+            return ds_blocks[0]
+        return xr.concat(ds_blocks, dim="time", data_vars="minimal", coords="minimal", compat="override")
+
+    def block_key(self, era5: 'Find_era5', var: List[str], block: slice, sel: tuple, model: str) -> str:
+        """
+        Args:
+            era5: Object used to load the data.
+            var: Variables requested.
+            block: Block of time.
+            sel: Level, longitude and latitude selection.
+            model: Model requested e.g. `oper`.
+
+        Returns:
+            Unique name of the block in the store.
+        """
+        info = [era5.archive, str(era5.path), model, sorted(var), str(block.start), str(block.stop),
+                str(block.step)] + [repr(s) for s in sel]
+        return hashlib.sha1(json.dumps(info).encode()).hexdigest()
+
+    def _get_block(self, era5: 'Find_era5', args: tuple, key: str, files: List[str]) -> xr.Dataset:
+        # Returns block from store, extracting it first if not there or if its source files have changed
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            source_mtime = max(executor.map(lambda f: os.stat(f).st_mtime, files))
+        store = os.path.join(self.cache_dir, f"{key}.zarr")
+        with sqlite_connect(self.db_file) as conn:
+            row = conn.execute("SELECT source_mtime, n_files FROM blocks WHERE key = ?", (key,)).fetchone()
+        if row != (source_mtime, len(files)) or not os.path.exists(store):
+            self._write_block(era5._load(args), store)
+            with sqlite_connect(self.db_file) as conn:
+                conn.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)",
+                             (key, _dir_size(store), time.time(), source_mtime, len(files)))
+        else:
+            with sqlite_connect(self.db_file) as conn:
+                conn.execute("UPDATE blocks SET last_access = ? WHERE key = ?", (time.time(), key))
+        return xr.open_zarr(store)
+
+    def _write_block(self, ds: xr.Dataset, store: str) -> None:
+        # Writes to a temporary store first, so a failed write never leaves a partial block in the cache
+        ds = ds.chunk(self.plan_chunks(ds))
+        for v in ds.variables.values():
+            v.encoding = {}          # drop NetCDF encoding e.g. chunksizes, which does not apply to zarr
+        tmp_store = f"{store}.tmp-{os.getpid()}"
+        ds.to_zarr(tmp_store, mode='w', consolidated=True)
+        shutil.rmtree(store, ignore_errors=True)
+        os.rename(tmp_store, store)
+
+    def plan_chunks(self, ds: xr.Dataset) -> dict:
+        """
+        Chunks used to save a block: the whole block in time, and the full extent of all other dimensions unless
+        this would exceed `max_chunk_mb`, in which case the largest dimension is halved until it does not.
+
+        Args:
+            ds: Block of data to save.
+
+        Returns:
+            Chunk size for each dimension of `ds`.
+        """
+        chunks = dict(ds.sizes)
+        itemsize = max([ds[v].dtype.itemsize for v in ds.data_vars], default=8)
+        other_dims = [d for d in chunks if d != "time"]
+        while len(other_dims) > 0 and int(np.prod(list(chunks.values()))) * itemsize > self.max_chunk_size:
+            dim = max(other_dims, key=lambda d: chunks[d])
+            if chunks[dim] == 1:
+                break
+            chunks[dim] = int(np.ceil(chunks[dim] / 2))
+        return chunks
+
+    def _evict(self, protect: List[str]) -> None:
+        # Deletes least recently used blocks, not in protect, until the store is below max_size
+        with sqlite_connect(self.db_file) as conn:
+            rows = conn.execute("SELECT key, size FROM blocks ORDER BY last_access").fetchall()
+            total = sum(size for _, size in rows)
+            protect = set(protect)
+            for key, size in rows:
+                if total <= self.max_size:
+                    break
+                if key in protect:
+                    continue
+                shutil.rmtree(os.path.join(self.cache_dir, f"{key}.zarr"), ignore_errors=True)
+                conn.execute("DELETE FROM blocks WHERE key = ?", (key,))
+                total -= size
+
+    def size(self) -> int:
+        """
+        Returns:
+            Total size of all blocks in the store, in bytes.
+        """
+        with sqlite_connect(self.db_file) as conn:
+            return int(conn.execute("SELECT COALESCE(SUM(size), 0) FROM blocks").fetchone()[0])
+
+    def clear(self) -> None:
+        """
+        Deletes all blocks in the store.
+        """
+        with sqlite_connect(self.db_file) as conn:
+            keys = [key for key, in conn.execute("SELECT key FROM blocks").fetchall()]
+            for key in keys:
+                shutil.rmtree(os.path.join(self.cache_dir, f"{key}.zarr"), ignore_errors=True)
+            conn.execute("DELETE FROM blocks")
+
+
+def _dir_size(path: str) -> int:
+    # Total size in bytes of all files within path
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
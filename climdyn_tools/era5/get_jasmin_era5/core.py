@@ -1,19 +1,30 @@
 from datetime import datetime
+import os
 import pathlib
 import numpy as np
 import pandas as pd
 import xarray as xr
 import warnings
-from typing import Literal
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Literal, Optional, Union, List, Iterator, Tuple
 
-from .utils import get_pl, get_gz, sel_era5, convert_lnsp_to_sp
+from .utils import get_ab, get_ab_full, integrate_gz_columns, filter_sel, sel_era5, convert_lnsp_to_sp, \
+    split_time_slice
+from .file_index import Era5_index, scan_dir, dates_to_hours, parse_era5_filename
+from .cache import Era5_cache
+from ...utils.streaming import Running_stats
+from ...utils.chunking import plan_chunks, dims_chunks
 
 
 class Find_era5:
     """
 
     """
-    def __init__(self, archive: Literal[None, 1, 't'] = None):
+    def __init__(self, archive: Literal[None, 1, 't'] = None, index: Optional[Union[str, Era5_index]] = None,
+                 cache: Optional[Union[str, Era5_cache]] = None, data_dir: Optional[str] = None,
+                 chunks: Optional[Union[dict, Literal["plan"]]] = None):
         """
         Initialise object to load ERA5 data from JASMIN.
 
@@ -24,15 +35,37 @@ class Find_era5:
                 * `1` to use ERA5.1 at `/badc/ecmwf-era51`,
                     which is suggested for model level data in years 2000-2006 inclusive.
                 * `t` to use Preliminary at `/badc/ecmwf-era5t`, near real-time data
+            index: Optional file index of the archive, used to find files rather than searching the archive
+                for every hour requested. Can be an `Era5_index` or the path to its SQLite file.
+                The index is not updated automatically, call `Era5_index.refresh` for this.
+            cache: Optional local Zarr cache of data already loaded, used for requests over a period of time.
+                Can be an `Era5_cache` or the directory in which to save it.
+            data_dir: Directory containing the `oper/`, `enda/` and `invariants/` directories.
+                If `None`, will be the `data/` directory of the `archive` on JASMIN.
+            chunks: Dask chunks of the loaded data. If `None`, there is one chunk per file.
+                If `plan`, chunks are chosen with `climdyn_tools.utils.chunking.plan_chunks` from the size and
+                internal chunking of the files, so they are a whole number of files and fit in memory.
+                Otherwise a dictionary of chunk sizes used to open each file.
         """
-        self._init_vars(archive)
-        self.pl = Pressure_levels_era5(archive)
-        self.gz = Geopotential_levels_era5(archive)
-        self.enda = Ensemble_era5(archive)
-
-    def _init_vars(self, archive: Literal[None, 1, 't'] = None):
+        self._init_vars(archive, index, cache, data_dir, chunks)
+        self.pl = Pressure_levels_era5(archive, self.index, self.cache, data_dir, chunks)
+        self.gz = Geopotential_levels_era5(archive, self.index, self.cache, data_dir, chunks)
+        self.enda = Ensemble_era5(archive, self.index, data_dir)
+
+    def _init_vars(self, archive: Literal[None, 1, 't'] = None, index: Optional[Union[str, Era5_index]] = None,
+                   cache: Optional[Union[str, Era5_cache]] = None, data_dir: Optional[str] = None,
+                   chunks: Optional[Union[dict, Literal["plan"]]] = None):
+        self.chunks = chunks
         self.archive = '' if archive is None else str(archive)
-        self.path = pathlib.Path(f"/badc/ecmwf-era5{self.archive}/data/")
+        if data_dir is None:
+            data_dir = f"/badc/ecmwf-era5{self.archive}/data/"
+        self.path = pathlib.Path(data_dir)
+        if isinstance(index, str):
+            index = Era5_index(index, archive, data_dir)
+        self.index = index
+        if isinstance(cache, str):
+            cache = Era5_cache(cache)
+        self.cache = cache
         self._INVARIANTS = [
             "anor",
             "cl",
@@ -57,6 +90,11 @@ class Find_era5:
         self._ML_WARNING_YEARS = np.arange(2000, 2007).tolist()  # in these years model level data suffer from statospheric cold biases - should use ERA5.1
 
     def __getitem__(self, args):
+        if self.cache is not None and isinstance(args[1], slice):
+            return self.cache.get(self, args)
+        return self._load(args)
+
+    def _load(self, args):
         var = args[0]
         date = args[1]
         sel = {}
@@ -72,26 +110,12 @@ class Find_era5:
         else:
             model = "oper"
 
-        if isinstance(date, slice):
-            if date.step is None:
-                freq = "1h"
-            else:
-                freq = date.step
-            dates = (
-                pd.date_range(
-                    pd.to_datetime(date.start),
-                    pd.to_datetime(date.stop),
-                    inclusive="left",
-                    freq=freq,
-                )
-                .to_pydatetime()
-                .tolist()
-            )
-        else:
-            dates = [pd.to_datetime(date).to_pydatetime()]
+        dates = self._get_dates(date)
 
         if isinstance(var, str):
             var = [var]
+        else:
+            var = list(var)         # copy so removing sp below does not change caller's list
 
         # If requested surface pressure, must get log of surface pressure first and convert later
         # Record info here
@@ -108,31 +132,15 @@ class Find_era5:
 
         self.warn_missing_years(var, dates)
 
-        files = sum(
-            [
-                self.find_files(v, dates, model=model)
-                for v in var
-                if v not in self._INVARIANTS
-            ],
-            [],
-        )
+        files = self.find_files_batch([v for v in var if v not in self._INVARIANTS], dates, model=model)
         ds = None
         if len(files) > 0:
-            ds = xr.open_mfdataset(files, combine="by_coords")
-            ds = sel_era5(ds, sel)
-        invar_files = sum(
-            [
-                self.find_files(v, dates, model=model)
-                for v in var
-                if v in self._INVARIANTS
-            ],
-            [],
-        )
+            ds = self.open_files(files, sel, self.chunks)
+        invar_files = [f for v in var if v in self._INVARIANTS for f in self.find_invariant(v)]
         if len(invar_files) > 0:
-            invar_ds = xr.open_mfdataset(invar_files, combine="by_coords").squeeze(
+            invar_ds = self.open_files(invar_files, sel, self.chunks).squeeze(
                 drop=True
             )
-            invar_ds = sel_era5(invar_ds, sel)
             if len(files) > 0:
                 for invar in invar_ds.data_vars:
                     ds[invar] = invar_ds[invar]
@@ -150,20 +158,206 @@ class Find_era5:
 
         return ds
 
+    @staticmethod
+    def _get_dates(date) -> List[datetime]:
+        # All dates within the slice date, or just date if a single date
+        if isinstance(date, slice):
+            if date.step is None:
+                freq = "1h"
+            else:
+                freq = date.step
+            return (
+                pd.date_range(
+                    pd.to_datetime(date.start),
+                    pd.to_datetime(date.stop),
+                    inclusive="left",
+                    freq=freq,
+                )
+                .to_pydatetime()
+                .tolist()
+            )
+        return [pd.to_datetime(date).to_pydatetime()]
+
+    def find_source_files(self, var: Union[str, List[str]], date, model: str = "oper") -> List[str]:
+        """
+        Finds all files which would be read by `Find_era5[var, date, ..., model]`.
+
+        Args:
+            var: Variable or list of variables.
+            date: Single date or slice of dates.
+            model: Model requested e.g. `oper` or `enda`.
+
+        Returns:
+            Path to every file found, including invariant files.
+        """
+        var = [var] if isinstance(var, str) else list(var)
+        var = ['lnsp' if v == 'sp' else v for v in var]       # sp is computed from lnsp
+        files = self.find_files_batch([v for v in var if v not in self._INVARIANTS], self._get_dates(date),
+                                      model=model)
+        return files + [str(f) for v in var if v in self._INVARIANTS for f in self.find_invariant(v)]
+
+    def iter_chunks(self, var: Union[str, List[str]], date: slice, level=None, longitude=None, latitude=None,
+                    model: str = "oper", chunk: str = "1D", prefetch: int = 1) -> Iterator[xr.Dataset]:
+        """
+        Iterates over a long period one block of time at a time, so only a block needs to be in memory at once.
+
+        Each block is loaded in full with the selection applied. While a block is being used,
+        the next `prefetch` blocks are loaded in a background thread.
+
+        Examples:
+            ```
+            stats = Running_stats(dim='time')
+            for ds in era5.iter_chunks('2t', slice('1980-01-01', '2020-01-01'), chunk='1MS'):
+                stats.update(ds)
+            ```
+
+        Args:
+            var: Variable or list of variables to load.
+            date: Period to iterate over, `date.step` gives the frequency within each block (`1h` if `None`).
+            level: Level selection, as the third argument of `Find_era5[...]`.
+            longitude: Longitude selection, as the fourth argument of `Find_era5[...]`.
+            latitude: Latitude selection, as the fifth argument of `Find_era5[...]`.
+            model: Model requested e.g. `oper` or `enda`.
+            chunk: Pandas frequency string giving length of each block e.g. `1D` for daily or `1MS` for monthly
+                blocks. Blocks start at the start of each period, so the first and last blocks may be shorter.
+            prefetch: Number of blocks to load ahead of the one being used. `0` for no prefetching.
+
+        Returns:
+            Generator of datasets, one for each block of time.
+        """
+        blocks = split_time_slice(date, chunk)
+
+        def load_block(block: slice) -> xr.Dataset:
+            return self[(var if isinstance(var, str) else list(var), block, level, longitude, latitude,
+                         model)].load()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = deque(executor.submit(load_block, block) for block in blocks[:prefetch + 1])
+            next_block = prefetch + 1
+            while len(pending) > 0:
+                ds = pending.popleft().result()
+                if next_block < len(blocks):
+                    pending.append(executor.submit(load_block, blocks[next_block]))
+                    next_block += 1
+                yield ds
+
+    @staticmethod
+    def open_files(files: List[str], sel: dict, chunks: Optional[Union[dict, Literal["plan"]]] = None) -> xr.Dataset:
+        """
+        Opens and combines files, applying the selection `sel` to each file as it is opened.
+
+        Selecting each file before combining means that coordinates are only decoded and combined over the
+        requested region. All files have the same grid, so coordinates are taken from the first file rather
+        than compared across all files.
+
+        Args:
+            files: Files to open.
+            sel: Selection with keys `level`, `longitude` and/or `latitude`, as used by `sel_era5`.
+            chunks: Chunks used to open each file, or `plan` to choose them with `plan_chunks`.
+                If `None`, there is one chunk per file.
+
+        Returns:
+            Combined dataset.
+        """
+        chunks_plan = None
+        if chunks == "plan":
+            # Each file has one variable, so plan from the first file of each, after the selection
+            var_files = {}
+            for f in files:
+                file_info = parse_era5_filename(os.path.basename(f))
+                var_files.setdefault(os.path.basename(f) if file_info is None else file_info[0], []).append(f)
+            ds_first = [xr.open_dataset(v_files[0]) for v_files in var_files.values()]
+            try:
+                chunks_plan = plan_chunks(xr.merge([sel_era5(ds, sel) for ds in ds_first], compat="override",
+                                                   join="override"),
+                                          ds_first[0].sizes.get("time", 1), max(len(v) for v in var_files.values()))
+            finally:
+                for ds in ds_first:
+                    ds.close()
+            chunks = {d: -1 for d in chunks_plan}      # whole files, rechunked after the selection
+        ds = xr.open_mfdataset(files, combine="by_coords", preprocess=partial(sel_era5, sel=sel),
+                               coords="minimal", compat="override", data_vars="minimal", chunks=chunks)
+        if chunks_plan is not None:
+            ds = ds.chunk(dims_chunks(chunks_plan, ds.dims))
+        return ds
+
     def find_files(
         self, var: str, dates: list[datetime], model: str = "oper"
     ) -> list[str]:
         if var in self._INVARIANTS:
             return self.find_invariant(var)
         else:
-            return sum(
-                [self.find_single_file(var, date, model=model) for date in dates], []
-            )
+            return self.find_files_batch([var], dates, model=model)
+
+    def find_files_batch(self, var: List[str], dates: List[datetime], model: str = "oper",
+                         max_workers: int = 8) -> List[str]:
+        """
+        Finds files for all variables and dates in a single pass.
+
+        Rather than a `glob` for every variable and hour, each `{model}/{level_type}/YYYY/MM/DD/` directory
+        containing one of the `dates` is listed once, with the listings done concurrently.
+        If an `index` was provided, it is used instead.
+
+        Args:
+            var: List of variables to find (not invariant variables).
+            dates: Dates to find.
+            model: Model requested e.g. `oper` or `enda`.
+            max_workers: Number of threads used to list directories concurrently.
+
+        Returns:
+            Path to every file found, sorted by variable (in the order given by `var`), then time.
+        """
+        level_type = "em_sfc" if model == "enda" else "*"
+        return self.find_files_table(var, dates, model, level_type, max_workers)["path"].tolist()
+
+    def find_files_table(self, var: List[str], dates: List[datetime], model: str = "oper", level_type: str = "*",
+                         max_workers: int = 8) -> pd.DataFrame:
+        """
+        Finds files for all variables and dates in a single pass, as with `find_files_batch`,
+        but also returns the variable and time of each file.
+
+        Args:
+            var: List of variables to find (not invariant variables).
+            dates: Dates to find.
+            model: Model requested e.g. `oper` or `enda`.
+            level_type: Only find files of this level type e.g. `an_sfc`. Can contain `*` wildcards.
+            max_workers: Number of threads used to list directories concurrently.
+
+        Returns:
+            Dataframe with columns `path`, `var` and `time` (hours since 1970-01-01), with a row for each file found,
+                sorted by variable (in the order given by `var`), then time, then path.
+        """
+        columns = ["path", "var", "time"]
+        if len(var) == 0 or len(dates) == 0:
+            return pd.DataFrame([], columns=columns)
+        if self.index is not None:
+            paths = [f for v in var for f in self.index.find_files(v, dates, model=model, level_type=level_type)]
+            records = [(f,) + parse_era5_filename(os.path.basename(f)) for f in paths]
+        else:
+            if "*" in level_type:
+                level_types = sorted(p.name for p in (self.path / model).glob(level_type) if p.is_dir())
+            else:
+                level_types = [level_type]
+            days = sorted({(d.year, d.month, d.day) for d in dates})
+            dirs = [self.path / model / lt / f"{year:04d}" / f"{month:02d}" / f"{day:02d}"
+                    for lt in level_types for year, month, day in days]
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                listings = list(executor.map(lambda d: scan_dir(str(d)), dirs))
+            records = [(str(d / rec[-1]),) + rec[:-1] for d, listing in zip(dirs, listings) for rec in listing]
+        if len(records) == 0:
+            return pd.DataFrame([], columns=columns)
+        df = pd.DataFrame(records, columns=["path", "var", "model", "level_type", "time", "invariant"])
+        df = df[df["var"].isin(var) & (df["model"] == model) & ~df["invariant"]
+                & np.isin(df["time"].to_numpy(), dates_to_hours(dates))]
+        df = df.assign(var_order=df["var"].map({v: i for i, v in enumerate(var)}))
+        return df.sort_values(["var_order", "time", "path"])[columns].reset_index(drop=True)
 
     def find_invariant(self, var: str) -> list[str]:
         if self.archive != '':
             warnings.warn(f'Using base archive (ecmwf-era5), for invariant var={var} '
                           f'despite requested archive of ecmwf-era5{self.archive}.')
+        if self.index is not None:
+            return self.index.find_invariant(var)
         date = self._INVARIANT_DATE
         files = sorted(
             list(
@@ -182,6 +376,8 @@ class Find_era5:
             level_type = "em_sfc"
         else:
             level_type = "*"
+        if self.index is not None:
+            return self.index.find_files(var, [date], model=model, level_type=level_type)
         files = sorted(
             list(
                 self.path.glob(
@@ -215,10 +411,17 @@ class Find_era5:
 
 
 class Pressure_levels_era5(Find_era5):
-    def __init__(self, archive: Literal[None, 1, 't'] = None):
-        self._init_vars(archive)
+    def __init__(self, archive: Literal[None, 1, 't'] = None, index: Optional[Union[str, Era5_index]] = None,
+                 cache: Optional[Union[str, Era5_cache]] = None, data_dir: Optional[str] = None,
+                 chunks: Optional[Union[dict, Literal["plan"]]] = None):
+        self._init_vars(archive, index, cache, data_dir, chunks)
 
     def __getitem__(self, args):
+        # Only the requested levels are computed, and the result is lazy if the surface pressure is
+        sel = {}
+        if len(args) > 1 and args[1] is not None:
+            sel = filter_sel({"level": args[1]})
+        levels = get_levels_sel(sel)
         ds_args = (
             "lnsp",
             args[0],
@@ -226,73 +429,89 @@ class Pressure_levels_era5(Find_era5):
         )
         if len(args) > 2:
             ds_args = ds_args + args[2:]
-        ps = super().__getitem__(ds_args)
-        pl = get_pl(np.exp(ps.lnsp.to_numpy()), 137).swapaxes(0, 1)
-        sel = {}
-        if len(args) > 1 and args[1] is not None:
-            sel["level"] = args[1]
-            if isinstance(sel["level"], slice):
-                if sel["level"].start is None:
-                    sel["level"] = slice(1, sel["level"].stop, sel["level"].step)
-                if sel["level"].stop is None:
-                    sel["level"] = slice(sel["level"].start, 137, sel["level"].step)
-        return xr.DataArray(
-            pl,
-            dims=("time", "level", "latitude", "longitude"),
-            coords={
-                "level": range(1, 138),
-                "time": ps.time,
-                "longitude": ps.longitude,
-                "latitude": ps.latitude,
-            },
-        ).sel(sel)
+        ps = np.exp(super().__getitem__(ds_args).lnsp)
+        a_full, b_full, _, _ = get_ab_full(137)
+        a_full = xr.DataArray(a_full[levels - 1], dims="level", coords={"level": levels})
+        b_full = xr.DataArray(b_full[levels - 1], dims="level", coords={"level": levels})
+        pl = (a_full + b_full * ps).transpose("time", "level", "latitude", "longitude")
+        if np.isscalar(sel.get("level")):
+            pl = pl.sel(sel)        # remove level dimension if requested single level
+        return pl
 
 
 class Geopotential_levels_era5(Find_era5):
-    def __init__(self, archive: Literal[None, 1, 't'] = None):
-        self._init_vars(archive)
+    def __init__(self, archive: Literal[None, 1, 't'] = None, index: Optional[Union[str, Era5_index]] = None,
+                 cache: Optional[Union[str, Era5_cache]] = None, data_dir: Optional[str] = None,
+                 chunks: Optional[Union[dict, Literal["plan"]]] = None):
+        self._init_vars(archive, index, cache, data_dir, chunks)
 
     def __getitem__(self, args):
+        # Geopotential on a level only depends on the levels below it, so only load levels from the highest
+        # level requested down to the surface. Integration is done lazily on each dask chunk.
+        sel = {}
+        if len(args) > 1 and args[1] is not None:
+            sel = filter_sel({"level": args[1]})
+        level_top = int(get_levels_sel(sel).min())
         ds_args = (
             ["lnsp", "z", "t", "q"],
             args[0],
-            None,
+            slice(level_top, 137),
         )
         if len(args) > 2:
             ds_args = ds_args + args[2:]
         ds = super().__getitem__(ds_args)
-        gz = get_gz(
-            np.exp(ds.lnsp.to_numpy()),
-            ds.z.to_numpy() * 9.81,
-            ds.t.to_numpy().swapaxes(0, 1),
-            ds.q.to_numpy().swapaxes(0, 1),
-            137,
-        ).swapaxes(0, 1)
-        sel = {}
-        if len(args) > 1 and args[1] is not None:
-            sel["level"] = args[1]
-            if isinstance(sel["level"], slice):
-                if sel["level"].start is None:
-                    sel["level"] = slice(1, sel["level"].stop, sel["level"].step)
-                if sel["level"].stop is None:
-                    sel["level"] = slice(sel["level"].start, 137, sel["level"].step)
-        return xr.DataArray(
-            gz,
-            dims=("time", "level", "latitude", "longitude"),
-            coords={
-                "level": range(1, 138),
-                "time": ds.time,
-                "longitude": ds.longitude,
-                "latitude": ds.latitude,
-            },
-        ).sel(sel)
+        a, b = get_ab(137)
+        gz = xr.apply_ufunc(
+            _gz_level_last,
+            np.exp(ds.lnsp),
+            ds.z * 9.81,
+            ds.t.chunk({"level": -1}),
+            ds.q.chunk({"level": -1}),
+            kwargs={"a": a[level_top - 1:], "b": b[level_top - 1:], "include_top": level_top == 1},
+            input_core_dims=[[], [], ["level"], ["level"]],
+            output_core_dims=[["level"]],
+            dask="parallelized",
+            output_dtypes=[np.float64],
+        )
+        gz = gz.assign_coords(level=np.arange(level_top, 138)).transpose("time", "level", "latitude", "longitude")
+        return gz.sel(sel)
+
+
+def get_levels_sel(sel: dict, n_levels: int = 137) -> np.ndarray:
+    """
+    Returns the model levels which would be kept after applying `sel` to data on all levels.
+
+    Args:
+        sel: Selection which may contain the key `level`.
+        n_levels: Number of model levels.
+
+    Returns:
+        `int [n_levels_sel]`</br>
+            Model levels (1 is the top level) kept after the selection.
+    """
+    levels = xr.DataArray(np.arange(1, n_levels + 1), dims="level", coords={"level": np.arange(1, n_levels + 1)})
+    return np.atleast_1d(levels.sel({k: v for k, v in sel.items() if k == "level"}).values)
+
+
+def _gz_level_last(ps: np.ndarray, gzs: np.ndarray, T: np.ndarray, q: np.ndarray, a: np.ndarray, b: np.ndarray,
+                   include_top: bool) -> np.ndarray:
+    # Wrapper of integrate_gz_columns for a block where level is the last dimension of T and q
+    n = T.shape[-1]
+    col_shape = np.broadcast_shapes(ps.shape, gzs.shape, T.shape[:-1])
+    gz = integrate_gz_columns(np.broadcast_to(ps, col_shape).reshape(-1),
+                              np.broadcast_to(gzs, col_shape).reshape(-1),
+                              np.moveaxis(np.broadcast_to(T, col_shape + (n,)), -1, 0).reshape(n, -1),
+                              np.moveaxis(np.broadcast_to(q, col_shape + (n,)), -1, 0).reshape(n, -1),
+                              a, b, include_top=include_top)
+    return np.moveaxis(gz.reshape((n,) + col_shape), 0, -1)
 
 
 class Ensemble_era5(Find_era5):
-    def __init__(self, archive: Literal[None, 1, 't'] = None):
-        self._init_vars(archive)
+    def __init__(self, archive: Literal[None, 1, 't'] = None, index: Optional[Union[str, Era5_index]] = None,
+                 data_dir: Optional[str] = None):
+        self._init_vars(archive, index, data_dir=data_dir)
 
-    def __getitem__(self, args):
+    def _parse_args(self, args) -> Tuple[List[str], list[datetime], dict]:
         var = args[0]
         date = args[1]
         sel = {}
@@ -304,7 +523,7 @@ class Ensemble_era5(Find_era5):
             sel["latitude"] = args[4]
         if isinstance(date, slice):
             if date.step is None:
-                freq = "1H"
+                freq = "1h"
             else:
                 freq = date.step
             dates = (
@@ -322,38 +541,74 @@ class Ensemble_era5(Find_era5):
 
         if isinstance(var, str):
             var = [var]
-        files = [
-            self.find_files(v, dates, model="enda")
-            for v in var
-            if v not in self._INVARIANTS
-        ]
-        if len(files) > 0:
-            ds_list = [
-                [
-                    xr.open_mfdataset(
-                        f, combine="nested", concat_dim=("ensemble_member")
-                    ).assign_coords({"ensemble_member": range(1, len(f) + 1)})
-                    for f in fl
-                    if len(fl)
-                ]
-                for fl in files
-            ]
-            ds = xr.merge([xr.concat(dsl, dim="time") for dsl in ds_list if len(dsl)])
-            ds = sel_era5(ds, sel)
-        invar_files = sum(
-            [
-                self.find_files(v, dates, model="oper")
-                for v in var
-                if v in self._INVARIANTS
-            ],
-            [],
-        )
+        return list(var), dates, sel
+
+    def __getitem__(self, args):
+        var, dates, sel = self._parse_args(args)
+        members = self.open_members([v for v in var if v not in self._INVARIANTS], dates, sel)
+        ds = None
+        if len(members) > 0:
+            ds = xr.concat(members, dim="ensemble_member", coords="minimal", compat="override")
+        ds = self._add_invariants(ds, var, sel)
+        return ds
+
+    def mean_spread(self, args, ddof: int = 1) -> Tuple[xr.Dataset, xr.Dataset]:
+        """
+        Computes the ensemble mean and spread, loading one ensemble member at a time, so the full
+        stack of members never needs to be in memory.
+
+        Args:
+            args: Same arguments as for `Ensemble_era5[...]` e.g. `(("2t", "2d"), "2020-06-01":"2020-06-02":"3h")`.
+            ddof: Delta degrees of freedom for the spread (standard deviation across members).
+
+        Returns:
+            mean: Ensemble mean of each variable.
+            spread: Ensemble spread of each variable.
+        """
+        var, dates, sel = self._parse_args(args)
+        members = self.open_members([v for v in var if v not in self._INVARIANTS], dates, sel)
+        if len(members) == 0:
+            raise ValueError(f'No ensemble data found for ecmwf-era5{self.archive}, var={var} and date={args[1]}.')
+        stats = Running_stats(dim="ensemble_member")
+        for member in members:
+            stats.update(member)
+        return stats.mean, stats.std(ddof)
+
+    def open_members(self, var: List[str], dates: list[datetime], sel: dict,
+                     max_workers: int = 8) -> List[xr.Dataset]:
+        """
+        Finds all member files in one pass, then opens them concurrently, applying `sel` to each file.
+
+        Args:
+            var: List of variables to load (not invariant variables).
+            dates: Dates to load.
+            sel: Selection with keys `level`, `longitude` and/or `latitude`, as used by `sel_era5`.
+            max_workers: Number of threads used to list directories and open files concurrently.
+
+        Returns:
+            One lazy dataset for each ensemble member, containing all variables and dates,
+                with an `ensemble_member` dimension of size 1.
+        """
+        files = self.find_files_table(var, dates, model="enda", level_type="an_sfc", max_workers=max_workers)
+        if len(files) == 0:
+            return []
+        # Members are numbered by the order of their files for each variable and time
+        files["member"] = files.groupby(["var", "time"]).cumcount() + 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            files["ds"] = list(executor.map(lambda f: sel_era5(xr.open_dataset(f, chunks={}), sel), files["path"]))
+        members = []
+        for member, files_member in files.groupby("member"):
+            ds_member = xr.merge([xr.concat(files_var["ds"].tolist(), dim="time", coords="minimal",
+                                            compat="override", data_vars="minimal")
+                                  for _, files_var in files_member.groupby("var", sort=False)])
+            members.append(ds_member.expand_dims(ensemble_member=[member]))
+        return members
+
+    def _add_invariants(self, ds: Optional[xr.Dataset], var: List[str], sel: dict) -> xr.Dataset:
+        invar_files = [f for v in var if v in self._INVARIANTS for f in self.find_invariant(v)]
         if len(invar_files) > 0:
-            invar_ds = xr.open_mfdataset(invar_files, combine="by_coords").squeeze(
-                drop=True
-            )
-            invar_ds = sel_era5(invar_ds, sel)
-            if len(files) > 0:
+            invar_ds = self.open_files(invar_files, sel, self.chunks).squeeze(drop=True)
+            if ds is not None:
                 for invar in invar_ds.data_vars:
                     ds[invar] = invar_ds[invar]
             else:
@@ -369,6 +624,8 @@ class Ensemble_era5(Find_era5):
             return [self.find_single_file(var, date, model=model) for date in dates]
 
     def find_invariant(self, var: str) -> list[str]:
+        if self.index is not None:
+            return self.index.find_invariant(var)
         date = self._INVARIANT_DATE
         files = sorted(
             list(
@@ -387,6 +644,8 @@ class Ensemble_era5(Find_era5):
             level_type = "an_sfc"
         else:
             level_type = "*"
+        if self.index is not None:
+            return self.index.find_files(var, [date], model=model, level_type=level_type)
         files = sorted(
             list(
                 self.path.glob(
@@ -0,0 +1,228 @@
+import os
+import re
+import pathlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal, Optional, List, Tuple, Iterator
+from ...utils.sqlite import sqlite_connect, sqlite_create
+
+# e.g. ecmwf-era5_oper_an_ml_202006011200.t.nc or ecmwf-era5_oper_an_sfc_200001010000.z.inv.nc
+# Anything between the timestamp and the variable (e.g. ensemble member) is allowed but not recorded.
+FILE_NAME_PATTERN = re.compile(r"^ecmwf-era5[^_]*_(?P<model>[^_]+)_(?P<level_type>[^_]+_[^_]+)_"
+                               r"(?P<time>\d{10})[^.]*(?:\.[^.]+)*?\.(?P<var>[^.]+)(?P<inv>\.inv)?\.nc$")
+
+
+def parse_era5_filename(file_name: str) -> Optional[Tuple[str, str, str, int, bool]]:
+    """
+    Extracts the information contained in the name of an ERA5 file on JASMIN.
+
+    Args:
+        file_name: Name of file (not full path) e.g. `ecmwf-era5_oper_an_ml_202006011200.t.nc`.
+
+    Returns:
+        `None` if `file_name` is not an ERA5 file, otherwise a tuple containing:
+
+            * `var`: Variable name e.g. `t`.
+            * `model`: e.g. `oper` or `enda`.
+            * `level_type`: e.g. `an_ml` or `an_sfc`.
+            * `time`: Hours since 1970-01-01.
+            * `invariant`: Whether the file is one of the time invariant files.
+    """
+    match = FILE_NAME_PATTERN.match(file_name)
+    if match is None:
+        return None
+    t = match.group("time")
+    time = np.datetime64(f"{t[:4]}-{t[4:6]}-{t[6:8]}T{t[8:10]}", "h").astype(np.int64)
+    return (match.group("var"), match.group("model"), match.group("level_type"), int(time),
+            match.group("inv") is not None)
+
+
+def scan_dir(path: str) -> List[Tuple[str, str, str, int, bool, str]]:
+    """
+    Lists a single directory once, keeping only ERA5 files.
+
+    Args:
+        path: Directory to list e.g. `/badc/ecmwf-era5/data/oper/an_ml/2020/06/01`.
+
+    Returns:
+        List of `(var, model, level_type, time, invariant, file_name)` for every ERA5 file in `path`,
+            with `time` in hours since 1970-01-01.
+    """
+    records = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                info = parse_era5_filename(entry.name)
+                if info is not None:
+                    records.append(info + (entry.name,))
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def dates_to_hours(dates: List[datetime]) -> np.ndarray:
+    """
+    Converts list of dates to integer hours since 1970-01-01, as used to record times in `Era5_index`.
+
+    Args:
+        dates: List of dates.
+
+    Returns:
+        `int [n_dates]`</br>
+            Hours since 1970-01-01 for each date.
+    """
+    return np.asarray(dates, dtype="datetime64[h]").astype(np.int64)
+
+
+class Era5_index:
+    """
+    Persistent index of all ERA5 files in a JASMIN archive, saved as a local SQLite file.
+
+    The archive is scanned once with `refresh`, which records the `(var, model, level_type, time) → path` mapping
+    of every file in the `oper/`, `enda/` and `invariants/` directories. Subsequent calls to `refresh` only
+    re-list the day directories whose modification time has changed.
+    Files are then found through `find_files` with a single query, rather than a `glob` for every hour.
+
+    Examples:
+        ```
+        index = Era5_index('/home/users/$USER/era5_index.sqlite')
+        index.refresh(years=range(1979, 2024))    # slow the first time, quick afterwards
+        era5 = Find_era5(index=index)
+        ```
+    """
+    def __init__(self, index_file: str, archive: Literal[None, 1, 't'] = None, data_dir: Optional[str] = None):
+        """
+        Args:
+            index_file: Path to SQLite file in which to save the index. Will be created if does not exist.
+            archive: There are three types of ERA5 archives:
+
+                * `None` to use default ERA5 archive at `/badc/ecmwf-era5`
+                * `1` to use ERA5.1 at `/badc/ecmwf-era51`
+                * `t` to use Preliminary at `/badc/ecmwf-era5t`
+            data_dir: Directory containing the `oper/`, `enda/` and `invariants/` directories.
+                If `None`, will be the `data/` directory of the `archive` on JASMIN.
+        """
+        self.archive = '' if archive is None else str(archive)
+        if data_dir is None:
+            data_dir = f"/badc/ecmwf-era5{self.archive}/data/"
+        self.path = pathlib.Path(data_dir)
+        self.index_file = sqlite_create(index_file, [
+            "CREATE TABLE IF NOT EXISTS files (dir TEXT, var TEXT, model TEXT, level_type TEXT, "
+            "time INTEGER, invariant INTEGER, name TEXT)",
+            "CREATE INDEX IF NOT EXISTS files_lookup ON files (var, model, invariant, time)",
+            "CREATE INDEX IF NOT EXISTS files_dir ON files (dir)",
+            "CREATE TABLE IF NOT EXISTS dirs (dir TEXT PRIMARY KEY, mtime REAL)"])
+
+    def _walk_day_dirs(self, models: List[str], years: Optional[List[int]]) -> Iterator[str]:
+        # Yields relative path of each day directory e.g. oper/an_ml/2020/06/01
+        for model in models:
+            for level_type in _list_subdirs(self.path / model):
+                for year in _list_subdirs(self.path / model / level_type):
+                    if years is not None and (not year.isdigit() or int(year) not in years):
+                        continue
+                    for month in _list_subdirs(self.path / model / level_type / year):
+                        for day in _list_subdirs(self.path / model / level_type / year / month):
+                            yield f"{model}/{level_type}/{year}/{month}/{day}"
+
+    def refresh(self, models: Tuple[str, ...] = ("oper", "enda"), years: Optional[List[int]] = None,
+                invariants: bool = True, max_workers: int = 8) -> int:
+        """
+        Updates the index, only listing the day directories which are new or whose modification time has changed.
+
+        Args:
+            models: Which model directories of the archive to index.
+            years: Only index these years. If `None`, will index all years.
+            invariants: Whether to index the `invariants/` directory.
+            max_workers: Number of threads used to list directories concurrently.
+
+        Returns:
+            Number of directories which were re-listed.
+        """
+        if years is not None:
+            years = [int(year) for year in years]
+        with sqlite_connect(self.index_file) as conn:
+            known = dict(conn.execute("SELECT dir, mtime FROM dirs").fetchall())
+        dirs = list(self._walk_day_dirs(list(models), years))
+        if invariants:
+            dirs.append("invariants")
+        mtimes = {}
+        for d in dirs:
+            try:
+                mtimes[d] = os.stat(self.path / d).st_mtime
+            except FileNotFoundError:
+                continue
+        changed = [d for d, mtime in mtimes.items() if known.get(d) != mtime]
+
+        # Directories previously indexed within the requested models and years which no longer exist
+        def in_scope(d: str) -> bool:
+            parts = d.split('/')
+            if parts[0] == "invariants":
+                return invariants
+            return parts[0] in models and (years is None or (parts[2].isdigit() and int(parts[2]) in years))
+        removed = [d for d in known if d not in mtimes and in_scope(d)]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            listings = list(executor.map(lambda d: scan_dir(str(self.path / d)), changed))
+        with sqlite_connect(self.index_file) as conn:
+            for d in changed + removed:
+                conn.execute("DELETE FROM files WHERE dir = ?", (d,))
+                conn.execute("DELETE FROM dirs WHERE dir = ?", (d,))
+            for d, records in zip(changed, listings):
+                conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(d, var, model, level_type, time, int(inv), name)
+                                  for var, model, level_type, time, inv, name in records])
+                conn.execute("INSERT INTO dirs VALUES (?, ?)", (d, mtimes[d]))
+        return len(changed)
+
+    def find_files(self, var: str, dates: List[datetime], model: str = "oper",
+                   level_type: str = "*") -> List[str]:
+        """
+        Finds the files containing `var` at each of the `dates`.
+
+        Args:
+            var: Variable to find e.g. `t`.
+            dates: Dates to find, must be on the hour.
+            model: Model e.g. `oper` or `enda`.
+            level_type: Only return files of this level type e.g. `an_ml`. Can contain `*` wildcards.
+
+        Returns:
+            Path to every file found, sorted by time.
+        """
+        if len(dates) == 0:
+            return []
+        times = dates_to_hours(dates)
+        with sqlite_connect(self.index_file) as conn:
+            rows = conn.execute("SELECT time, dir, name FROM files WHERE var = ? AND model = ? AND invariant = 0 "
+                                "AND level_type GLOB ? AND time BETWEEN ? AND ? ORDER BY time, dir, name",
+                                (var, model, level_type, int(times.min()), int(times.max()))).fetchall()
+        if len(rows) == 0:
+            return []
+        df = pd.DataFrame(rows, columns=["time", "dir", "name"])
+        df = df[np.isin(df["time"].to_numpy(), times)]
+        return [str(self.path / d / name) for d, name in zip(df["dir"], df["name"])]
+
+    def find_invariant(self, var: str) -> List[str]:
+        """
+        Finds the time invariant file containing `var`.
+
+        Args:
+            var: Invariant variable to find e.g. `lsm`.
+
+        Returns:
+            Path to the invariant files found.
+        """
+        with sqlite_connect(self.index_file) as conn:
+            rows = conn.execute("SELECT dir, name FROM files WHERE var = ? AND invariant = 1 ORDER BY name",
+                                (var,)).fetchall()
+        return [str(self.path / d / name) for d, name in rows]
+
+
+def _list_subdirs(path: pathlib.Path) -> List[str]:
+    # Sorted names of all directories in path, empty if path does not exist
+    try:
+        with os.scandir(path) as it:
+            return sorted(entry.name for entry in it if entry.is_dir())
+    except FileNotFoundError:
+        return []
@@ -1,4 +1,6 @@
 from .ds_slicing import area_weighting, area_weight_mean_lat, lat_lon_coord_slice, lat_lon_rolling, time_rolling
 from .xarray import print_ds_var_list, set_attrs
 from . import constants
-from .base import round_any, split_list_max_n, parse_int_list
\ No newline at end of file
+from .base import round_any, split_list_max_n, parse_int_list
+from .streaming import Running_stats, Running_histogram
+from .chunking import plan_chunks
\ No newline at end of file
@@ -0,0 +1,136 @@
+import os
+import numpy as np
+import xarray as xr
+import dask
+from dask.utils import parse_bytes
+from typing import Optional, List
+
+# Memory of a task is taken to be this many times its input chunk, to allow for the output and intermediate arrays
+TASK_MEMORY_FACTOR = 4
+
+
+def default_memory_budget() -> int:
+    """
+    Returns:
+        Half of the physical memory of the machine in bytes, or 4GB if this cannot be found.
+    """
+    try:
+        return int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2)
+    except (ValueError, OSError, AttributeError):
+        return int(4e9)
+
+
+def disk_chunks(var: xr.Variable) -> Optional[dict]:
+    """
+    Args:
+        var: Variable opened from a file.
+
+    Returns:
+        Internal chunk size of each dimension of `var` in the file, from the `chunksizes` (NetCDF4) or
+            `chunks` (Zarr) encoding. `None` if the variable is stored contiguously e.g. in a NetCDF3 file.
+    """
+    sizes = var.encoding.get('chunksizes') or var.encoding.get('chunks')
+    if sizes is None or len(sizes) != len(var.dims):
+        return None
+    return dict(zip(var.dims, (int(s) for s in sizes)))
+
+
+def plan_chunks(ds: xr.Dataset, file_length: Optional[int] = None, n_files: int = 1,
+                memory_budget: Optional[float] = None, n_workers: Optional[int] = None,
+                concat_dim: str = 'time', max_chunk_bytes: Optional[float] = None) -> dict:
+    """
+    Chooses dask chunks for a dataset made by combining `n_files` files along `concat_dim`, so that
+    `n_workers` tasks, each holding one chunk of the largest variable, fit within `memory_budget`.
+
+    Dimensions other than `concat_dim` are kept whole unless a single step of `concat_dim` is too large, in which
+    case the largest is halved, rounded to a multiple of its internal chunk size in the file, until it fits.
+    Along `concat_dim`, chunks are a whole number of files if a file fits, so each file is only read by one task,
+    but there are still at least `n_workers` chunks if there are enough files.
+    Otherwise, they are the largest divisor of `file_length` that fits, preferring multiples of the internal chunk
+    size, so no chunk spans two files or splits an internal chunk.
+
+    Args:
+        ds: Dataset of a single file, only the dimensions, dtypes and encoding are used so can be lazy.
+        file_length: Length of `concat_dim` in each file. If `None`, files are not considered and `concat_dim`
+            chunks are a multiple of its internal chunk size.
+        n_files: Number of files combined.
+        memory_budget: Memory available for the computation in bytes. If `None`, will be half the physical memory.
+        n_workers: Number of tasks run at the same time. If `None`, will be the number of CPUs.
+        concat_dim: Dimension along which files are combined.
+        max_chunk_bytes: Maximum size of a chunk in bytes. If `None`, will be the dask `array.chunk-size` setting.
+
+    Returns:
+        Chunk size for each dimension of `ds`.
+    """
+    memory_budget = default_memory_budget() if memory_budget is None else memory_budget
+    n_workers = (os.cpu_count() or 1) if n_workers is None else n_workers
+    if max_chunk_bytes is None:
+        max_chunk_bytes = parse_bytes(dask.config.get('array.chunk-size'))
+    target = max(1, min(memory_budget / (n_workers * TASK_MEMORY_FACTOR), max_chunk_bytes))
+    chunks = dict(ds.sizes)
+    data_vars = [var for var in ds.data_vars.values() if var.ndim > 0]
+    if len(data_vars) == 0:
+        return chunks
+    # Chunks along each dimension are shared by all variables, so set by the largest
+    var = max(data_vars, key=lambda v: v.dtype.itemsize * int(np.prod([s for d, s in v.sizes.items()
+                                                                        if d != concat_dim])))
+    var_disk_chunks = disk_chunks(var.variable) or {}
+    other_dims = [d for d in var.dims if d != concat_dim]
+
+    def step_size() -> int:
+        return var.dtype.itemsize * int(np.prod([chunks[d] for d in other_dims]))
+
+    while step_size() > target:
+        dim = max(other_dims, key=lambda d: chunks[d], default=None)
+        if dim is None or chunks[dim] == 1:
+            break
+        size = int(np.ceil(chunks[dim] / 2))
+        disk_size = var_disk_chunks.get(dim, 1)
+        if size > disk_size:
+            size = int(np.ceil(size / disk_size)) * disk_size
+        chunks[dim] = size if size < chunks[dim] else int(np.ceil(chunks[dim] / 2))
+
+    if concat_dim in var.dims:
+        n_steps = max(1, int(target // step_size()))
+        disk_size = var_disk_chunks.get(concat_dim, 1)
+        if file_length is None:
+            n_steps = min(n_steps, chunks[concat_dim])
+            chunks[concat_dim] = disk_size * (n_steps // disk_size) if n_steps >= disk_size else n_steps
+        elif n_steps >= file_length:
+            n_files_chunk = min(n_steps // file_length, max(1, n_files // n_workers))
+            chunks[concat_dim] = file_length * n_files_chunk
+        else:
+            divisors = [d for d in range(1, n_steps + 1) if file_length % d == 0]
+            aligned = [d for d in divisors if d % disk_size == 0]
+            chunks[concat_dim] = max(aligned or divisors)
+    return chunks
+
+
+def file_chunks(chunks: dict, file_length: int, concat_dim: str = 'time') -> dict:
+    """
+    Chunks to open each file with, before combining the files and rechunking to `chunks`.
+
+    Args:
+        chunks: Chunks of the combined dataset, as returned by `plan_chunks`.
+        file_length: Length of `concat_dim` in each file.
+        concat_dim: Dimension along which files are combined.
+
+    Returns:
+        `chunks`, with the chunk along `concat_dim` no longer than a file.
+    """
+    chunks = dict(chunks)
+    if concat_dim in chunks:
+        chunks[concat_dim] = min(chunks[concat_dim], file_length)
+    return chunks
+
+
+def dims_chunks(chunks: dict, dims: List[str]) -> dict:
+    """
+    Args:
+        chunks: Chunk size for each dimension.
+        dims: Dimensions of the dataset to chunk.
+
+    Returns:
+        `chunks` only including dimensions in `dims`, so can be passed to `xarray.Dataset.chunk`.
+    """
+    return {d: size for d, size in chunks.items() if d in dims}
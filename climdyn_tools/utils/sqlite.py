@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import contextlib
+from typing import Iterator, List
+
+
+@contextlib.contextmanager
+def sqlite_connect(path: str, timeout: float = 60) -> Iterator[sqlite3.Connection]:
+    """
+    Connection to a SQLite file, as a context manager which commits on success, rolls back on error
+    and always closes the connection.
+
+    Args:
+        path: Path to SQLite file.
+        timeout: Seconds to wait for another process to release a lock on the file.
+
+    Yields:
+        Open connection.
+    """
+    conn = sqlite3.connect(path, timeout=timeout)
+    try:
+        with conn:      # commits on success, rolls back on error
+            yield conn
+    finally:
+        conn.close()
+
+
+def sqlite_create(path: str, schema: List[str]) -> str:
+    """
+    Creates a SQLite file and its directory if they do not exist, and runs the `CREATE ... IF NOT EXISTS`
+    statements of `schema`.
+
+    Args:
+        path: Path to SQLite file, can contain `~` and environment variables.
+        schema: Statements to run e.g. `["CREATE TABLE IF NOT EXISTS files (name TEXT)"]`.
+
+    Returns:
+        `path` with `~` and environment variables expanded.
+    """
+    path = os.path.expandvars(os.path.expanduser(path))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with sqlite_connect(path) as conn:
+        for statement in schema:
+            conn.execute(statement)
+    return path
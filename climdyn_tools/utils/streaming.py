@@ -0,0 +1,129 @@
+from typing import Optional, Union
+import numpy as np
+import xarray as xr
+
+
+class Running_stats:
+    """
+    Running count, mean, variance, minimum and maximum along a dimension, updated with one block of data at a time.
+
+    Only the current statistics are kept in memory, so a statistic over many years of data can be computed
+    from a stream of blocks e.g. those yielded by `Find_era5.iter_chunks`. Blocks are combined with the parallel
+    algorithm of Chan et al. (1979), which is numerically stable. Missing values are ignored.
+
+    Examples:
+        ```
+        stats = Running_stats(dim='time')
+        for ds in era5.iter_chunks('2t', slice('1980-01-01', '2020-01-01'), chunk='1MS'):
+            stats.update(ds)
+        stats.mean, stats.std()
+        ```
+    """
+    def __init__(self, dim: str = 'time'):
+        """
+        Args:
+            dim: Dimension to compute statistics along, all other dimensions are kept.
+        """
+        self.dim = dim
+        self.count = None
+        self.mean = None
+        self.min = None
+        self.max = None
+        self._m2 = None         # sum of squared differences from the mean
+
+    def update(self, ds: Union[xr.Dataset, xr.DataArray]) -> None:
+        """
+        Include a new block of data in the statistics.
+
+        Args:
+            ds: Block of data, must contain the dimension `dim`. Will be loaded into memory.
+        """
+        ds = ds.load()
+        count = ds.count(self.dim)
+        mean = ds.mean(self.dim).fillna(0)
+        m2 = ((ds - mean) ** 2).sum(self.dim)
+        ds_min = ds.min(self.dim)
+        ds_max = ds.max(self.dim)
+        if self.count is None:
+            self.count, self.mean, self._m2, self.min, self.max = count, mean, m2, ds_min, ds_max
+            return
+        count_total = self.count + count
+        count_total_safe = count_total.where(count_total > 0, 1)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / count_total_safe
+        self._m2 = self._m2 + m2 + delta ** 2 * self.count * count / count_total_safe
+        self.count = count_total
+        self.min = xr.apply_ufunc(np.fmin, self.min, ds_min)
+        self.max = xr.apply_ufunc(np.fmax, self.max, ds_max)
+
+    def var(self, ddof: int = 0) -> Union[xr.Dataset, xr.DataArray]:
+        """
+        Args:
+            ddof: Delta degrees of freedom, the divisor used is `count - ddof`.
+
+        Returns:
+            Variance of all data included so far.
+        """
+        return (self._m2 / (self.count - ddof)).where(self.count > ddof)
+
+    def std(self, ddof: int = 0) -> Union[xr.Dataset, xr.DataArray]:
+        """
+        Args:
+            ddof: Delta degrees of freedom, the divisor used is `count - ddof`.
+
+        Returns:
+            Standard deviation of all data included so far.
+        """
+        return np.sqrt(self.var(ddof))
+
+
+class Running_histogram:
+    """
+    Histogram along a dimension at every other coordinate e.g. of every grid point over time,
+    updated with one block of data at a time.
+
+    Examples:
+        ```
+        hist = Running_histogram(np.arange(220, 330, 2), dim='time')
+        for ds in era5.iter_chunks('2t', slice('1980-01-01', '2020-01-01'), chunk='1MS'):
+            hist.update(ds.t2m)
+        hist.counts
+        ```
+    """
+    def __init__(self, bins: Union[np.ndarray, list], dim: str = 'time'):
+        """
+        Args:
+            bins: `float [n_bins+1]`</br>
+                Edges of the bins, must be increasing. Values outside the bins are not counted.
+            dim: Dimension to compute the histogram along.
+        """
+        self.bins = np.asarray(bins)
+        self.dim = dim
+        self.counts: Optional[Union[xr.Dataset, xr.DataArray]] = None
+
+    def update(self, ds: Union[xr.Dataset, xr.DataArray]) -> None:
+        """
+        Include a new block of data in the histogram.
+
+        Args:
+            ds: Block of data, must contain the dimension `dim`.
+        """
+        counts = xr.apply_ufunc(_histogram_last_axis, ds, kwargs={'bins': self.bins},
+                                input_core_dims=[[self.dim]], output_core_dims=[['bin']],
+                                dask='parallelized', output_dtypes=[np.int64],
+                                dask_gufunc_kwargs={'output_sizes': {'bin': self.bins.size - 1}}).load()
+        counts = counts.assign_coords(bin=0.5 * (self.bins[1:] + self.bins[:-1]))
+        self.counts = counts if self.counts is None else self.counts + counts
+
+
+def _histogram_last_axis(values: np.ndarray, bins: np.ndarray) -> np.ndarray:
+    # Histogram along last axis of values for all other indices, in a single pass using bincount
+    n_bins = bins.size - 1
+    point_shape = values.shape[:-1]
+    values = values.reshape(-1, values.shape[-1])
+    ind = np.searchsorted(bins, values, side='right') - 1
+    ind[values == bins[-1]] = n_bins - 1          # include right edge in last bin, like np.histogram
+    valid = (ind >= 0) & (ind < n_bins) & ~np.isnan(values)
+    ind = ind + n_bins * np.arange(values.shape[0])[:, np.newaxis]
+    counts = np.bincount(ind[valid], minlength=values.shape[0] * n_bins)
+    return counts.reshape(point_shape + (n_bins,))